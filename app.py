@@ -1,8 +1,14 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+import os
+import time
+from itertools import islice
 import db_manager
 import news_engine
+import image_processor
+import job_queue
+import metrics
 
 # Set page config
 st.set_page_config(page_title="AI News Automation Dashboard", layout="wide")
@@ -10,19 +16,86 @@ st.set_page_config(page_title="AI News Automation Dashboard", layout="wide")
 # --- Initialize DB ---
 db_manager.init_db()
 
+# --- Edit Buffer ---
+# Card edits are collected here and written in one transaction, either once
+# typing has paused for AUTOSAVE_DEBOUNCE_SECONDS or when "Save" is clicked.
+AUTOSAVE_DEBOUNCE_SECONDS = 3
+
+if "pending_edits" not in st.session_state:
+    st.session_state.pending_edits = {}
+    st.session_state.last_edit_at = 0.0
+
+def mark_dirty(item_id, field, widget_key):
+    """Widget callback: buffers an edit instead of writing it to the database."""
+    st.session_state.pending_edits.setdefault(item_id, {})[field] = st.session_state[widget_key]
+    st.session_state.last_edit_at = time.time()
+
+def flush_pending_edits():
+    """Writes all buffered edits in a single transaction."""
+    edits = st.session_state.pending_edits
+    if edits:
+        db_manager.update_news_items(edits)
+        st.session_state.pending_edits = {}
+    return len(edits)
+
+@st.fragment(run_every=AUTOSAVE_DEBOUNCE_SECONDS)
+def autosave_status():
+    """Flushes the edit buffer once edits have been idle for the debounce interval."""
+    if st.session_state.pending_edits and time.time() - st.session_state.last_edit_at >= AUTOSAVE_DEBOUNCE_SECONDS:
+        flush_pending_edits()
+    unsaved = len(st.session_state.pending_edits)
+    st.caption(f"📝 {unsaved} unsaved card(s)" if unsaved else "✅ All changes saved")
+
+# --- Cached Reads ---
+# Keyed on db_manager.get_data_version(), which changes whenever news_posts is
+# written by this app or by the scheduler. Reruns without changes skip SQLite.
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_metrics(data_version):
+    return db_manager.get_metrics()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_news_page(data_version, status, start_date, end_date, cursor, limit):
+    rows, next_cursor = db_manager.get_news_page(
+        status=status, start_date=start_date, end_date=end_date, cursor=cursor, limit=limit
+    )
+    return [dict(row) for row in rows], next_cursor
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_search_page(data_version, query, status, start_date, end_date, cursor, limit):
+    rows, next_cursor = db_manager.search_news(
+        query, status=status, start_date=start_date, end_date=end_date, cursor=cursor, limit=limit
+    )
+    return [dict(row) for row in rows], next_cursor
+
+# Metric samples are not tracked by data_version, so refresh them on a timer
+@st.cache_data(ttl=30, show_spinner=False)
+def cached_performance(last_runs):
+    return metrics.latency_summary(last_runs), metrics.calls_per_run(last_runs)
+
 # --- Sidebar ---
 st.sidebar.title("Settings")
 st.sidebar.markdown("---")
 
 if st.sidebar.button("🚀 Trigger AI Fetch Now"):
+    flush_pending_edits()
     with st.spinner("Fetching and generating news..."):
-        count = news_engine.trigger_news_workflow(auto_post=False) # Default to false for UI feedback
+        # Goes through the job queue, so it never overlaps a scheduled run
+        job_id, count = job_queue.run_now(auto_post=False) # Default to false for UI feedback
+    if job_id is None:
+        st.sidebar.warning("A fetch is already queued or running, try again when it has finished.")
+    elif count is None:
+        st.sidebar.info(f"Fetch queued as job {job_id}; the scheduler is running it.")
+    else:
         st.sidebar.success(f"Added {count} new items!")
         st.rerun()
 
 auto_post_mode = st.sidebar.checkbox("Auto-Post Mode", value=False, help="If checked, new fetches bypass approval.")
 
 st.sidebar.markdown("---")
+if st.sidebar.button("💾 Save Changes"):
+    st.sidebar.success(f"Saved {flush_pending_edits()} edited item(s)")
+with st.sidebar:
+    autosave_status()
 st.sidebar.info("Application Status: Connected to SQLite")
 
 # --- Main Area ---
@@ -30,60 +103,192 @@ st.title("AI News Automation Dashboard")
 st.write(f"Today is: {datetime.now().strftime('%B %d, %Y')}")
 
 # Metrics Row
-total, pending, posted = db_manager.get_metrics()
+data_version = db_manager.get_data_version()
+total, pending, posted = cached_metrics(data_version)
 m1, m2, m3 = st.columns(3)
 m1.metric("Total Fetched", total)
 m2.metric("Pending Approval", pending, delta_color="inverse")
 m3.metric("Posted", posted)
 
+with st.expander("⏱️ Performance"):
+    latencies, calls = cached_performance(20)
+    if not latencies:
+        st.caption("No workflow runs recorded yet.")
+    else:
+        st.markdown("**Latency per stage** (last 20 runs)")
+        st.dataframe(pd.DataFrame(latencies), hide_index=True, use_container_width=True)
+        st.markdown("**API calls per run**")
+        st.dataframe(pd.DataFrame(calls).fillna(0), hide_index=True, use_container_width=True)
+
+# --- Archive (read-only) ---
+# Archived posts are streamed from the compressed files and only while the
+# toggle is on, so normal reruns never touch the archive.
+ARCHIVE_VIEW_LIMIT = 50
+
+def render_archived_item(record):
+    """Read-only card for an archived post."""
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        image_path = record.get('thumbnail_path') or record.get('image_path')
+        image = None
+        if record.get('image_archive') and image_path:
+            image = db_manager.read_archived_image(record['image_archive'], image_path)
+        elif image_path and image_path.startswith(("http://", "https://")):
+            image = image_path
+        if image:
+            st.image(image, use_container_width=True)
+    with col2:
+        st.markdown(f"**{record['original_title']}**")
+        st.caption(f"{record['created_at']} · {record['status']} · [Source]({record['source_url']})")
+        if record.get('fb_post_id'):
+            st.caption(f"Published {record.get('fb_posted_at') or ''} · [Facebook post](https://www.facebook.com/{record['fb_post_id']})")
+        st.write(record['summary_content'])
+
+with st.expander("🗄️ Archive"):
+    months = db_manager.list_archive_months()
+    if not months:
+        st.caption(f"No archived posts yet. Posts move here after {db_manager.ARCHIVE_AFTER_DAYS} days.")
+    elif st.toggle("Browse archived posts", key="browse_archive"):
+        a1, a2 = st.columns([3, 1])
+        archive_query = a1.text_input("Search archive", key="archive_query").strip()
+        archive_month = a2.selectbox("Month", ["All"] + months, key="archive_month")
+        records = list(islice(
+            db_manager.iter_archived_posts(archive_query or None, None if archive_month == "All" else [archive_month]),
+            ARCHIVE_VIEW_LIMIT
+        ))
+        st.caption(f"Showing {len(records)} archived post(s){' (first matches only)' if len(records) == ARCHIVE_VIEW_LIMIT else ''}")
+        for record in records:
+            render_archived_item(record)
+            st.divider()
+
 st.markdown("---")
 st.subheader("News Feed")
 
+# Catch up on edits left idle since the last rerun
+if st.session_state.pending_edits and time.time() - st.session_state.last_edit_at >= AUTOSAVE_DEBOUNCE_SECONDS:
+    flush_pending_edits()
+
 # --- News Feed Rendering ---
-news_items = db_manager.get_all_news()
+PAGE_SIZE = 20
+STATUS_TABS = {
+    "All": None,
+    "⏳ Pending": "pending",
+    "✅ Approved": "approved",
+    "📤 Posted": "posted",
+    "🚫 Rejected": "rejected",
+}
 
-if not news_items:
+def render_news_item(item, outbox_status=None):
+    """
+    Renders one news card with editable content and actions.
+    outbox_status is (status, error) of the post's publish outbox entry, if any.
+    """
+    with st.container(border=True):
+        col1, col2, col3 = st.columns([1, 2, 1])
+        
+        # Column 1: Image (small thumbnail; the full render only on demand)
+        with col1:
+            thumbnail_path = item['thumbnail_path']
+            if not thumbnail_path or not os.path.exists(thumbnail_path):
+                # Lazy backfill for posts stored before thumbnails existed
+                thumbnail_path = image_processor.ensure_thumbnail(item['image_path'])
+                if thumbnail_path:
+                    db_manager.set_thumbnail_path(item['id'], thumbnail_path)
+            if thumbnail_path:
+                st.image(thumbnail_path, use_container_width=True)
+                if st.toggle("🔍 Full image", key=f"full_{item['id']}"):
+                    st.image(item['image_path'], use_container_width=True)
+            elif item['image_path']:
+                st.image(item['image_path'], use_container_width=True)
+            st.caption(f"Source: [Link]({item['source_url']})")
+        
+        # Column 2: Content (Editable)
+        with col2:
+            # Use keys to identify state for each item; edits go to the buffer, not the DB
+            title_key = f"title_{item['id']}"
+            summary_key = f"summary_{item['id']}"
+            st.text_input("Headline", value=item['original_title'], key=title_key,
+                          on_change=mark_dirty, args=(item['id'], "title", title_key))
+            edited_summary = st.text_area("Summary", value=item['summary_content'], key=summary_key, height=150,
+                                          on_change=mark_dirty, args=(item['id'], "summary", summary_key))
+
+        # Column 3: Actions & Status
+        with col3:
+            status = item['status']
+            if status == 'pending':
+                st.warning("Status: Pending Approval")
+                if st.button("✅ Approve & Post", key=f"post_{item['id']}", type="primary"):
+                    flush_pending_edits()
+                    # Queued in the outbox; the publisher posts it in the background
+                    if news_engine.post_to_facebook(item['id'], edited_summary, item['image_path']):
+                        st.success("Queued for Facebook!")
+                        st.rerun()
+            elif status == 'approved':
+                outbox_state, outbox_error = outbox_status or (None, None)
+                if outbox_state == 'failed':
+                    st.error("Status: Publishing to Facebook failed")
+                    st.caption(outbox_error or "Unknown error")
+                else:
+                    st.info("Status: Approved, publishing to Facebook")
+                if st.button("🔁 Retry Posting", key=f"retry_{item['id']}",
+                             help="Queues the post again if an earlier attempt failed."):
+                    news_engine.post_to_facebook(item['id'], edited_summary, item['image_path'])
+                    st.rerun()
+            elif status == 'posted':
+                st.success("Status: Posted")
+            elif status == 'rejected':
+                st.error("Status: Rejected")
+            
+            if st.button("🗑️ Delete", key=f"del_{item['id']}"):
+                st.session_state.pending_edits.pop(item['id'], None)
+                flush_pending_edits()
+                db_manager.delete_news_item(item['id'])
+                st.rerun()
+
+search_query = st.text_input("Search", placeholder="🔎 Search headlines and summaries",
+                             label_visibility="collapsed").strip()
+tab = st.radio("Status", list(STATUS_TABS), horizontal=True, label_visibility="collapsed")
+date_range = st.sidebar.date_input("Created between", value=(), help="Leave empty to show all dates.")
+start_date = date_range[0] if len(date_range) > 0 else None
+end_date = date_range[1] + timedelta(days=1) if len(date_range) > 1 else None
+
+# Reset "load more" whenever the filters change
+filter_key = (search_query, tab, start_date, end_date)
+if st.session_state.get("feed_filter") != filter_key:
+    st.session_state.feed_filter = filter_key
+    st.session_state.feed_pages = 1
+
+# Fetch only the pages the user has asked for, following the page cursors;
+# a search query switches the feed to relevance-ranked results
+news_items = []
+cursor = None
+for _ in range(st.session_state.feed_pages):
+    if search_query:
+        page, cursor = cached_search_page(
+            data_version, search_query, STATUS_TABS[tab], start_date, end_date, cursor, PAGE_SIZE
+        )
+    else:
+        page, cursor = cached_news_page(
+            data_version, STATUS_TABS[tab], start_date, end_date, cursor, PAGE_SIZE
+        )
+    news_items.extend(page)
+    if cursor is None:
+        break
+
+if not news_items and search_query:
+    st.info(f"No news items match '{search_query}'.")
+elif not news_items:
     st.info("No news items found. Click 'Trigger AI Fetch Now' to get started.")
 else:
+    # Read fresh, not cached: the publisher updates the outbox without touching news_posts
+    outbox = db_manager.get_outbox_status(item['id'] for item in news_items if item['status'] == 'approved')
     for item in news_items:
-        with st.container(border=True):
-            col1, col2, col3 = st.columns([1, 2, 1])
-            
-            # Column 1: Image
-            with col1:
-                st.image(item['image_path'], use_container_width=True)
-                st.caption(f"Source: [Link]({item['source_url']})")
-            
-            # Column 2: Content (Editable)
-            with col2:
-                # Use keys to identify state for each item
-                edited_title = st.text_input("Headline", value=item['original_title'], key=f"title_{item['id']}")
-                edited_summary = st.text_area("Summary", value=item['summary_content'], key=f"summary_{item['id']}", height=150)
-                
-                # Auto-save logic (simulated by checking if values changed and updating DB)
-                if edited_title != item['original_title'] or edited_summary != item['summary_content']:
-                    db_manager.update_news_item(item['id'], title=edited_title, summary=edited_summary)
-                    # No need to rerun here, Streamlit will handle local state, but DB is updated.
-
-            # Column 3: Actions & Status
-            with col3:
-                status = item['status']
-                if status == 'pending':
-                    st.warning("Status: Pending Approval")
-                    if st.button("✅ Approve & Post", key=f"post_{item['id']}", type="primary"):
-                        # Mock posting
-                        if news_engine.post_to_facebook(item['id'], edited_summary, item['image_path']):
-                            db_manager.update_news_item(item['id'], status='posted')
-                            st.success("Posted to Facebook!")
-                            st.rerun()
-                elif status == 'posted':
-                    st.success("Status: Posted")
-                elif status == 'rejected':
-                    st.error("Status: Rejected")
-                
-                if st.button("🗑️ Delete", key=f"del_{item['id']}"):
-                    db_manager.delete_news_item(item['id'])
-                    st.rerun()
+        render_news_item(item, outbox.get(item['id']))
+    
+    if cursor is not None and st.button("⬇️ Load more", key="load_more"):
+        flush_pending_edits()
+        st.session_state.feed_pages += 1
+        st.rerun()
 
 # --- Custom Styling ---
 st.markdown("""
@@ -0,0 +1,77 @@
+import re
+import json
+import time
+import random
+import threading
+
+
+class FakeRateLimitError(Exception):
+    """Raised like the API's quota error; gemini_client recognises the 429 in the message."""
+
+    code = 429
+
+
+class FakeGemini:
+    """
+    Offline stand-in for google.generativeai's GenerativeModel.
+    Answers the selection and translation prompts news_engine sends, after
+    `latency` seconds (plus up to `jitter`), and fails with a 429 for a
+    `rate_limit_rate` fraction of calls.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, rate_limit_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.calls = 0
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def model_factory(self, model_name):
+        """Drop-in replacement for genai.GenerativeModel."""
+        return _FakeModel(self, model_name)
+
+    def _respond(self, prompt):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            limited = self._random.random() < self.rate_limit_rate
+            if limited:
+                self.rate_limited += 1
+        time.sleep(delay)
+        if limited:
+            raise FakeRateLimitError("429 Resource has been exhausted (e.g. check quota).")
+
+        selection = re.search(r"From the following (\d+) news items, select the top (\d+)", prompt)
+        if selection:
+            count, top_n = int(selection.group(1)), int(selection.group(2))
+            return json.dumps(list(range(1, min(count, top_n) + 1)))
+
+        ids = [int(i) for i in re.findall(r"\(id: (\d+)\)", prompt)]
+        if ids:
+            return json.dumps(
+                [{"id": i, "headline": f"ข่าวคริปโต {i} " + "ก" * 20, "content": "เนื้อหา " * 200} for i in ids],
+                ensure_ascii=False
+            )
+        return json.dumps({"headline": "ข่าวคริปโต " + "ก" * 20, "content": "เนื้อหา " * 200}, ensure_ascii=False)
+
+
+class _FakeUsage:
+    def __init__(self, total_token_count):
+        self.total_token_count = total_token_count
+
+
+class _FakeResponse:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.usage_metadata = _FakeUsage(len(prompt) // 3 + len(text) // 3)
+
+
+class _FakeModel:
+    def __init__(self, backend, model_name):
+        self.backend = backend
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        return _FakeResponse(self.backend._respond(str(prompt)), str(prompt))
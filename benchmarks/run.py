@@ -0,0 +1,278 @@
+"""
+Offline end-to-end benchmarks for the news workflow.
+
+Feeds and images come from a local HTTP stub and Gemini is replaced by a fake
+with configurable latency and 429s, so no network access or API key is used.
+Every run works in a scratch directory (its own SQLite files, caches and
+generated images) and writes its results as JSON.
+
+    python -m benchmarks.run                          # 10, 1k and 100k items
+    python -m benchmarks.run --sizes 10,1000 --output bench.json
+    python -m benchmarks.run --baseline main.json     # exit 1 on regressions
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Never reach the real API, and keep the client's own limits out of the way
+# of the fake's latency. Set before the repo modules read their settings.
+os.environ["GEMINI_API_KEY"] = "benchmark"
+os.environ.setdefault("GEMINI_RPM", "100000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_manager
+import gemini_client
+import image_processor
+import llm_cache
+import metrics
+import news_engine
+from benchmarks.fake_gemini import FakeGemini
+from benchmarks.stub_server import StubServer
+
+DEFAULT_SIZES = "10,1000,100000"
+
+
+class Bench:
+    """Shared state for one benchmark session."""
+
+    def __init__(self, args, stub, gemini, workdir):
+        self.args = args
+        self.stub = stub
+        self.gemini = gemini
+        self.workdir = workdir
+        self.results = []
+
+    def fresh_state(self, name, size):
+        """Empty database and LLM cache, so each benchmark pays its own cold costs."""
+        db_manager.DB_PATH = os.path.join(self.workdir, f"size-{size}", f"{name}.db")
+        db_manager.init_db()
+        llm_cache.clear()
+
+    def measure(self, name, size, items, fn):
+        """Runs fn once and records its wall time, throughput and external calls."""
+        counters_before = metrics.counters()
+        gemini_before = (self.gemini.calls, self.gemini.rate_limited)
+        start = time.perf_counter()
+        output = fn()
+        seconds = time.perf_counter() - start
+
+        counters_after = metrics.counters()
+        calls = {
+            key: counters_after[key] - counters_before.get(key, 0)
+            for key in counters_after if counters_after[key] != counters_before.get(key, 0)
+        }
+        calls["gemini_fake_calls"] = self.gemini.calls - gemini_before[0]
+        calls["gemini_fake_429s"] = self.gemini.rate_limited - gemini_before[1]
+
+        result = {
+            "benchmark": name,
+            "size": size,
+            "items": items,
+            "seconds": round(seconds, 4),
+            "items_per_second": round(items / seconds, 2) if seconds else None,
+            "calls": calls,
+        }
+        self.results.append(result)
+        print(f"  {name:<32} {items:>7} items  {seconds:9.3f}s  {result['items_per_second'] or 0:>10.1f}/s")
+        return output
+
+
+def bench_fetch(bench, size):
+    bench.fresh_state("fetch", size)
+    feeds = bench.stub.feeds(size)
+    items = bench.measure("fetch_rss_news", size, size, lambda: news_engine.fetch_rss_news(feeds))
+    # Second fetch: every feed answers 304 and the cached entries are reused
+    bench.measure("fetch_rss_news_not_modified", size, size, lambda: news_engine.fetch_rss_news(feeds))
+    return items
+
+def bench_select(bench, size, items):
+    bench.fresh_state("select", size)
+    window = news_engine.SELECT_WINDOW
+    windows = [items[i:i + window] for i in range(0, min(len(items), bench.args.max_llm_items), window)]
+
+    def run():
+        return [news_engine.select_interesting_news(chunk, top_n=3) for chunk in windows]
+
+    bench.measure("select_interesting_news", size, sum(len(chunk) for chunk in windows), run)
+
+def bench_translate(bench, size, items):
+    bench.fresh_state("translate", size)
+    sample = items[:bench.args.max_llm_items]
+
+    def run_single():
+        with ThreadPoolExecutor(max_workers=gemini_client.get_client().max_concurrency) as executor:
+            return list(executor.map(lambda item: news_engine.generate_thai_content(item['title'], item['summary']), sample))
+
+    bench.measure("generate_thai_content", size, len(sample), run_single)
+    llm_cache.clear()
+    bench.measure("generate_thai_content_batch", size, len(sample),
+                  lambda: news_engine.generate_thai_content_batch(sample))
+
+def bench_render(bench, size, items):
+    sample = items[:bench.args.max_renders]
+    out_dir = os.path.join(bench.workdir, f"size-{size}", "renders")
+    os.makedirs(out_dir, exist_ok=True)
+
+    def run():
+        return [
+            image_processor.add_headline_to_image(
+                item['image_url'], item['title'][:60], os.path.join(out_dir, f"{index}.jpg")
+            )
+            for index, item in enumerate(sample)
+        ]
+
+    bench.measure("add_headline_to_image", size, len(sample), run)
+
+def bench_db(bench, size, items):
+    bench.fresh_state("db", size)
+    urls = [item['url'] for item in items]
+
+    def insert():
+        for item in items:
+            db_manager.add_news_item(item['title'], item['summary'], None, item['url'])
+
+    def page_scan():
+        rows, cursor = db_manager.get_news_page(limit=100)
+        count = len(rows)
+        while cursor:
+            rows, cursor = db_manager.get_news_page(cursor=cursor, limit=100)
+            count += len(rows)
+        return count
+
+    bench.measure("db_insert", size, size, insert)
+    bench.measure("db_known_urls", size, size, lambda: db_manager.get_known_urls(urls))
+    bench.measure("db_page_scan", size, size, page_scan)
+    bench.measure("db_metrics", size, 100, lambda: [db_manager.get_metrics() for _ in range(100)])
+
+def bench_workflow(bench, size):
+    bench.fresh_state("workflow", size)
+    with open("feeds.json", "w", encoding="utf-8") as f:
+        json.dump(bench.stub.feeds(size), f)
+    bench.measure("trigger_news_workflow", size, size,
+                  lambda: news_engine.trigger_news_workflow(auto_post=False, top_n=bench.args.top_n))
+
+
+def run_size(bench, size):
+    size_dir = os.path.join(bench.workdir, f"size-{size}")
+    os.makedirs(size_dir, exist_ok=True)
+    os.chdir(size_dir)
+    print(f"\n▶️ {size} items")
+
+    items = bench_fetch(bench, size)
+    if len(items) != size:
+        raise RuntimeError(f"stub served {len(items)} items, expected {size}")
+    bench_select(bench, size, items)
+    bench_translate(bench, size, items)
+    bench_render(bench, size, items)
+    bench_db(bench, size, items)
+    bench_workflow(bench, size)
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(results, baseline_path, tolerance):
+    """Returns the benchmarks whose time per item grew by more than `tolerance` over the baseline."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["benchmark"], r["size"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        before = baseline.get((result["benchmark"], result["size"]))
+        if not before or not before["items"] or not result["items"]:
+            continue
+        old = before["seconds"] / before["items"]
+        new = result["seconds"] / result["items"]
+        if old and new > old * (1 + tolerance):
+            regressions.append({
+                "benchmark": result["benchmark"], "size": result["size"],
+                "baseline_seconds": before["seconds"], "seconds": result["seconds"],
+                "slowdown": round(new / old, 2),
+            })
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the news workflow.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated item counts (default: %(default)s)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file (default: %(default)s)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown per item before a benchmark counts as a regression (default: %(default)s)")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="fake Gemini latency in seconds")
+    parser.add_argument("--gemini-jitter", type=float, default=0.02, help="extra random fake Gemini latency")
+    parser.add_argument("--gemini-429-rate", type=float, default=0.0, help="fraction of fake Gemini calls that fail with 429")
+    parser.add_argument("--backoff-base", type=float, default=gemini_client.BACKOFF_BASE_SECONDS,
+                        help="first 429 backoff delay in seconds")
+    parser.add_argument("--server-latency", type=float, default=0.0, help="stub HTTP server latency in seconds")
+    parser.add_argument("--max-llm-items", type=int, default=500,
+                        help="items sent to the selection/translation benchmarks at most")
+    parser.add_argument("--max-renders", type=int, default=100, help="images rendered by the render benchmark at most")
+    parser.add_argument("--top-n", type=int, default=3, help="stories selected per run in the workflow benchmark")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep the scratch directory for inspection")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    gemini = FakeGemini(args.gemini_latency, args.gemini_jitter, args.gemini_429_rate)
+    gemini_client.genai.GenerativeModel = gemini.model_factory
+    gemini_client.BACKOFF_BASE_SECONDS = args.backoff_base
+
+    workdir = tempfile.mkdtemp(prefix="news-bench-")
+    llm_cache.LLM_CACHE_PATH = os.path.join(workdir, "llm_cache.db")
+    original_cwd = os.getcwd()
+    started = time.time()
+    try:
+        with StubServer(args.server_latency) as stub:
+            bench = Bench(args, stub, gemini, workdir)
+            for size in sizes:
+                run_size(bench, size)
+    finally:
+        os.chdir(original_cwd)
+        if args.keep_workdir:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "duration_seconds": round(time.time() - started, 1),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": bench.results,
+    }
+    if baseline_path:
+        report["regressions"] = compare(bench.results, baseline_path, args.tolerance)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    for regression in report.get("regressions", []):
+        print(f"❌ {regression['benchmark']} @ {regression['size']}: {regression['slowdown']}x slower than baseline")
+    return 1 if report.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import io
+import random
+import threading
+import hashlib
+import urllib.parse
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+from PIL import Image, ImageDraw
+
+# Synthetic stories draw words from a large generated vocabulary, so
+# near-duplicate detection sees mostly distinct stories, as with real feeds.
+_SYLLABLES = "ba ko ri tu me sa lo vi ne du ka pe zo mi ta ru fe gi ho ly".split()
+WORDS = [a + b + c for a in _SYLLABLES for b in _SYLLABLES for c in _SYLLABLES]
+IMAGE_VARIANTS = 16
+IMAGE_SIZE = 1024
+
+
+def story(story_id):
+    """Deterministic title and summary for a synthetic story."""
+    rng = random.Random(story_id)
+    title = " ".join(rng.choice(WORDS) for _ in range(8)).capitalize() + f" #{story_id}"
+    summary = " ".join(rng.choice(WORDS) for _ in range(60)) + "."
+    return title, summary
+
+def render_feed(base_url, feed_id, items, first_id):
+    """RSS 2.0 document with `items` stories numbered from first_id."""
+    entries = []
+    for story_id in range(first_id, first_id + items):
+        title, summary = story(story_id)
+        entries.append(
+            "<item>"
+            f"<title>{escape(title)}</title>"
+            f"<link>{base_url}/story/{story_id}</link>"
+            f"<description>{escape(summary)}</description>"
+            f"<pubDate>{formatdate(1700000000 + story_id * 60, usegmt=True)}</pubDate>"
+            f'<enclosure url="{base_url}/image/{story_id % IMAGE_VARIANTS}.jpg" type="image/jpeg" length="0"/>'
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>Benchmark feed {feed_id}</title><link>{base_url}</link>"
+        f"<description>Synthetic feed</description>{''.join(entries)}</channel></rss>"
+    ).encode("utf-8")
+
+def render_image(variant):
+    """JPEG photo stand-in: a noisy colour field, so it compresses like a photo."""
+    rng = random.Random(variant)
+    img = Image.effect_noise((IMAGE_SIZE, IMAGE_SIZE), 48).convert("RGB")
+    overlay = Image.new("RGB", img.size, tuple(rng.randrange(256) for _ in range(3)))
+    img = Image.blend(img, overlay, 0.6)
+    ImageDraw.Draw(img).rectangle((100, 100, 500, 400), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class StubServer:
+    """
+    Local HTTP server standing in for RSS publishers and image hosts.
+      /feed/<id>.xml?items=N&first=K   synthetic RSS feed
+      /image/<n>.jpg                   synthetic photo
+    Both honour If-None-Match, answering 304 like a well-behaved server.
+    `latency` adds a fixed delay (seconds) to every response.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._stop = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _body(self, path, query):
+        with self._cache_lock:
+            key = (path, query)
+            if key not in self._cache:
+                params = urllib.parse.parse_qs(query)
+                name = path.rsplit("/", 1)[-1].split(".")[0]
+                if path.startswith("/feed/"):
+                    body = render_feed(
+                        self.base_url, name,
+                        int(params.get("items", ["10"])[0]), int(params.get("first", ["0"])[0])
+                    )
+                    self._cache[key] = (body, "application/rss+xml")
+                elif path.startswith("/image/"):
+                    self._cache[key] = (render_image(int(name)), "image/jpeg")
+                else:
+                    return None
+            return self._cache[key]
+
+    def _handle(self, request):
+        if self._stop.wait(self.latency):
+            return
+        parsed = urllib.parse.urlparse(request.path)
+        found = self._body(parsed.path, parsed.query)
+        if found is None:
+            request.send_error(404)
+            return
+
+        body, content_type = found
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            request.send_response(304)
+            request.send_header("ETag", etag)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+        request.send_response(200)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.send_header("ETag", etag)
+        request.end_headers()
+        request.wfile.write(body)
+
+    def feeds(self, total_items, items_per_feed=500):
+        """Feed registry entries that together publish total_items distinct stories."""
+        feeds = []
+        for feed_id, first in enumerate(range(0, total_items, items_per_feed)):
+            items = min(items_per_feed, total_items - first)
+            feeds.append({
+                "name": f"bench-{feed_id}",
+                "url": f"{self.base_url}/feed/{feed_id}.xml?items={items}&first={first}",
+                "category": "benchmark",
+                "limit": items,
+            })
+        return feeds
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, name="bench-stub", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
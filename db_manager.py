@@ -1,14 +1,136 @@
 import sqlite3
 import os
-from datetime import datetime
+import io
+import json
+import time
+import queue
+import threading
+import gzip
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# Archive files are zstd-compressed when the zstandard package is installed, gzip otherwise
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 DB_PATH = "news_database.db"
+# Stay below SQLite's default limit on bound parameters per statement
+MAX_SQL_VARIABLES = 900
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "10000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+# Per-connection cache of compiled statements, reused across pooled checkouts
+DB_STATEMENT_CACHE_SIZE = 256
+# How long get_data_version trusts its last read when this process has not written
+DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", "2"))
+# Tiered storage: posts older than ARCHIVE_AFTER_DAYS move to compressed
+# JSONL files under ARCHIVE_DIR, partitioned by month, and their images to
+# one zip per month
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_ZSTD_LEVEL = 10
 
-def init_db():
-    """Initializes the SQLite database and the news_posts table."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+
+def _configure(conn):
+    """Applies the connection pragmas: WAL journal, relaxed fsync, page cache and busy timeout."""
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    # NORMAL is durable across application crashes in WAL mode; only a power loss can drop the last commits
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared by all threads of a process
+    (Streamlit sessions, scheduler and worker threads). Each connection is
+    used by one thread at a time; WAL mode lets other processes read while
+    one of them writes.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+        )
+        return _configure(conn)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Returns the process-wide pool, recreating it if DB_PATH was changed."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+@contextmanager
+def db_connection():
+    """
+    Checks a connection out of the pool for the duration of a with-block.
+    Commits on success and rolls back on error.
+    """
+    pool = _get_pool()
+    conn = pool.acquire()
+    changes_before = conn.total_changes
+    try:
+        yield conn
+        conn.commit()
+        if conn.total_changes != changes_before:
+            _invalidate_data_version()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+def _migration_1_news_posts(cursor):
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS news_posts (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -21,75 +143,989 @@ def init_db():
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     ''')
-    
-    conn.commit()
-    conn.close()
 
-def get_db_connection():
-    """Returns a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def _migration_2_unique_source_url(cursor):
+    # Keep one copy of any duplicated story so the unique index can be built:
+    # the one furthest along (posted, approved, rejected, then pending), oldest first
+    cursor.execute('''
+    DELETE FROM news_posts WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY source_url
+                ORDER BY CASE status WHEN 'posted' THEN 0 WHEN 'approved' THEN 1 WHEN 'rejected' THEN 2 ELSE 3 END, id
+            ) AS copy
+            FROM news_posts WHERE source_url IS NOT NULL
+        ) WHERE copy > 1
+    )
+    ''')
+    if cursor.rowcount > 0:
+        print(f"Removed {cursor.rowcount} duplicate posts (same source URL) before adding the unique index")
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_news_posts_source_url ON news_posts(source_url)')
+
+def _migration_3_feed_cache(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS feed_cache (
+        feed_url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        entries_json TEXT,
+        fetched_at DATETIME,
+        checked_at DATETIME
+    )
+    ''')
 
-def add_news_item(title, summary, image_path, url, status='pending', scheduled_time=None):
-    """Adds a new news item to the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _migration_4_story_fingerprints(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS story_fingerprints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER,
+        source_url TEXT,
+        signature BLOB NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS story_fingerprint_bands (
+        bucket INTEGER NOT NULL,
+        fingerprint_id INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_story_fingerprint_bands_bucket ON story_fingerprint_bands(bucket)')
+
+def _migration_5_feed_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_news_posts_created_at ON news_posts(created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_news_posts_status_created_at ON news_posts(status, created_at)')
+
+def _migration_6_status_counts(cursor):
+    # Per-status row counts kept current by triggers, so get_metrics never scans news_posts
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS news_status_counts (
+        status TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute('DELETE FROM news_status_counts')
+    cursor.execute('''
+    INSERT INTO news_status_counts (status, total)
+    VALUES ('pending', 0), ('approved', 0), ('posted', 0), ('rejected', 0), ('', 0)
+    ''')
+    cursor.execute('''
+    UPDATE news_status_counts SET total = (
+        SELECT COUNT(*) FROM news_posts WHERE IFNULL(news_posts.status, '') = news_status_counts.status
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_news_posts_count_insert AFTER INSERT ON news_posts
+    BEGIN
+        UPDATE news_status_counts SET total = total + 1 WHERE status = IFNULL(NEW.status, '');
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_news_posts_count_delete AFTER DELETE ON news_posts
+    BEGIN
+        UPDATE news_status_counts SET total = total - 1 WHERE status = IFNULL(OLD.status, '');
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_news_posts_count_update AFTER UPDATE OF status ON news_posts
+    WHEN IFNULL(OLD.status, '') != IFNULL(NEW.status, '')
+    BEGIN
+        UPDATE news_status_counts SET total = total - 1 WHERE status = IFNULL(OLD.status, '');
+        UPDATE news_status_counts SET total = total + 1 WHERE status = IFNULL(NEW.status, '');
+    END
+    ''')
+
+def _migration_7_thumbnail_path(cursor):
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(news_posts)')]
+    if 'thumbnail_path' not in columns:
+        cursor.execute('ALTER TABLE news_posts ADD COLUMN thumbnail_path TEXT')
+
+def _migration_8_data_version(cursor):
+    # Change counter bumped by every write to news_posts, from any process
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_news_posts_version_{event.lower()} AFTER {event} ON news_posts
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE id = 1;
+        END
+        ''')
+
+def _migration_9_workflow_jobs(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS workflow_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT NOT NULL CHECK(status IN ('queued', 'running', 'done', 'failed')) DEFAULT 'queued',
+        auto_post INTEGER NOT NULL DEFAULT 0,
+        top_n INTEGER NOT NULL DEFAULT 3,
+        lease_owner TEXT,
+        lease_expires_at REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        selected_at DATETIME,
+        error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_workflow_jobs_status ON workflow_jobs(status, id)')
+    # Per-item checkpoints: selected -> translated -> rendered -> posted
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS workflow_job_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER NOT NULL,
+        source_url TEXT NOT NULL,
+        stage TEXT NOT NULL CHECK(stage IN ('selected', 'translated', 'rendered', 'posted')),
+        payload TEXT NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(job_id, source_url)
+    )
+    ''')
+
+def _migration_10_metric_samples(cursor):
+    # Timings and call counts written by metrics.py, grouped by workflow run
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS metric_samples (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT,
+        name TEXT NOT NULL,
+        kind TEXT NOT NULL CHECK(kind IN ('timing', 'count')),
+        value REAL NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metric_samples_run ON metric_samples(run_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metric_samples_created_at ON metric_samples(created_at)')
+
+def _migration_11_publish_outbox(cursor):
+    # Posts waiting to be published to Facebook, drained by publisher.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS publish_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER NOT NULL UNIQUE,
+        message TEXT NOT NULL,
+        image_path TEXT,
+        status TEXT NOT NULL CHECK(status IN ('queued', 'sending', 'sent', 'failed')) DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        lease_expires_at REAL,
+        fb_post_id TEXT,
+        error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        sent_at DATETIME
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_publish_outbox_due ON publish_outbox(status, next_attempt_at)')
+
+def _migration_12_search_index(cursor):
+    # Full-text index over headlines and summaries. The trigram tokenizer
+    # matches any substring of 3+ characters, which works for Thai text
+    # (no spaces between words) as well as English.
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS news_posts_fts USING fts5(
+            original_title, summary_content,
+            content='news_posts', content_rowid='id', tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite without FTS5 or older than 3.34: search_news falls back to LIKE scans
+        print(f"Full-text search unavailable ({e}), search will scan posts")
+        return
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_news_posts_fts_insert AFTER INSERT ON news_posts
+    BEGIN
+        INSERT INTO news_posts_fts (rowid, original_title, summary_content)
+        VALUES (new.id, new.original_title, new.summary_content);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_news_posts_fts_delete AFTER DELETE ON news_posts
+    BEGIN
+        INSERT INTO news_posts_fts (news_posts_fts, rowid, original_title, summary_content)
+        VALUES ('delete', old.id, old.original_title, old.summary_content);
+    END
+    ''')
     cursor.execute('''
-    INSERT INTO news_posts (original_title, summary_content, image_path, source_url, status, scheduled_time)
-    VALUES (?, ?, ?, ?, ?, ?)
-    ''', (title, summary, image_path, url, status, scheduled_time or datetime.now()))
-    conn.commit()
-    conn.close()
+    CREATE TRIGGER IF NOT EXISTS trg_news_posts_fts_update AFTER UPDATE OF original_title, summary_content ON news_posts
+    BEGIN
+        INSERT INTO news_posts_fts (news_posts_fts, rowid, original_title, summary_content)
+        VALUES ('delete', old.id, old.original_title, old.summary_content);
+        INSERT INTO news_posts_fts (rowid, original_title, summary_content)
+        VALUES (new.id, new.original_title, new.summary_content);
+    END
+    ''')
+    cursor.execute("INSERT INTO news_posts_fts (news_posts_fts) VALUES ('rebuild')")
+
+def _migration_13_job_retry_delay(cursor):
+    # Requeued jobs wait until not_before (epoch seconds) before they can be claimed again
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(workflow_jobs)')}
+    if 'not_before' not in columns:
+        cursor.execute('ALTER TABLE workflow_jobs ADD COLUMN not_before REAL')
+
+def _migration_14_fingerprint_post_indexes(cursor):
+    # Archival deletes fingerprints by post
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_story_fingerprints_post ON story_fingerprints(post_id)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_story_fingerprint_bands_fingerprint ON story_fingerprint_bands(fingerprint_id)'
+    )
+
+# Ordered schema migrations. The database's PRAGMA user_version records the last
+# one applied; append new steps to the end and never edit released ones.
+# The early steps use IF NOT EXISTS because databases created before versioning
+# already contain some of these objects.
+MIGRATIONS = [
+    _migration_1_news_posts,
+    _migration_2_unique_source_url,
+    _migration_3_feed_cache,
+    _migration_4_story_fingerprints,
+    _migration_5_feed_indexes,
+    _migration_6_status_counts,
+    _migration_7_thumbnail_path,
+    _migration_8_data_version,
+    _migration_9_workflow_jobs,
+    _migration_10_metric_samples,
+    _migration_11_publish_outbox,
+    _migration_12_search_index,
+    _migration_13_job_retry_delay,
+    _migration_14_fingerprint_post_indexes,
+]
+
+_data_version = None
+_data_version_checked_at = 0.0
+
+def _invalidate_data_version():
+    global _data_version_checked_at
+    _data_version_checked_at = 0.0
+
+def get_data_version():
+    """
+    Returns the news_posts change counter, for invalidating read caches.
+    Triggers bump it on every insert, update and delete, including writes made
+    by other processes such as the scheduler. Writes made through this module
+    force a fresh read; otherwise the value is re-read at most once every
+    DATA_VERSION_POLL_SECONDS.
+    """
+    global _data_version, _data_version_checked_at
+    now = time.monotonic()
+    if _data_version is None or now - _data_version_checked_at >= DATA_VERSION_POLL_SECONDS:
+        with db_connection() as conn:
+            _data_version = conn.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+        _data_version_checked_at = time.monotonic()
+    return _data_version
+
+def init_db():
+    """Initializes the SQLite database and applies any pending schema migrations."""
+    with db_connection() as conn:
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        if current >= len(MIGRATIONS):
+            return
+
+        # Take the write lock first so concurrent processes apply each migration once
+        conn.execute('BEGIN IMMEDIATE')
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        cursor = conn.cursor()
+        for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            print(f"Applied database migration {version}: {migration.__name__}")
+
+def get_db_connection():
+    """Returns a new, unpooled connection to the SQLite database. The caller must close it."""
+    return _configure(sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000))
+
+def add_news_item(title, summary, image_path, url, status='pending', scheduled_time=None, thumbnail_path=None,
+                  publish=False):
+    """
+    Adds a new news item to the database. With publish, the summary is also
+    queued in the publish outbox in the same transaction, so a crash cannot
+    leave an auto-posted item stored but never published.
+    Returns the new row id, or None if a post with the same source_url already exists.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO news_posts (original_title, summary_content, image_path, source_url, status, scheduled_time, thumbnail_path)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(source_url) DO NOTHING
+        ''', (title, summary, image_path, url, status, scheduled_time or datetime.now(), thumbnail_path))
+        item_id = cursor.lastrowid if cursor.rowcount else None
+        if item_id and publish:
+            _enqueue_post(conn, item_id, summary, image_path)
+    return item_id
+
+def get_referenced_image_paths():
+    """Returns the set of image and thumbnail paths referenced by stored posts."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT image_path FROM news_posts WHERE image_path IS NOT NULL
+        UNION SELECT thumbnail_path FROM news_posts WHERE thumbnail_path IS NOT NULL
+        ''')
+        paths = {row[0] for row in cursor.fetchall()}
+    return paths
+
+def set_thumbnail_path(item_id, thumbnail_path):
+    """Stores the thumbnail generated for a news item."""
+    with db_connection() as conn:
+        conn.execute('UPDATE news_posts SET thumbnail_path = ? WHERE id = ?', (thumbnail_path, item_id))
+
+def get_known_urls(urls):
+    """Returns the subset of the given source URLs that already exist in news_posts."""
+    urls = list({url for url in urls if url})
+    known = set()
+    if not urls:
+        return known
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(urls), MAX_SQL_VARIABLES):
+            chunk = urls[start:start + MAX_SQL_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f'SELECT source_url FROM news_posts WHERE source_url IN ({placeholders})', chunk)
+            known.update(row[0] for row in cursor.fetchall())
+    return known
 
 def get_all_news():
     """Fetches all news items from the database, ordered by created_at."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM news_posts ORDER BY created_at DESC')
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM news_posts ORDER BY created_at DESC')
+        rows = cursor.fetchall()
     return rows
 
+def _utc_timestamp(value):
+    """
+    Converts a local date (midnight) or naive local datetime to the UTC text
+    format SQLite's CURRENT_TIMESTAMP writes to created_at columns.
+    """
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def get_news_page(status=None, start_date=None, end_date=None, cursor=None, limit=20):
+    """
+    Fetches one page of news items, newest first, using keyset pagination.
+    status filters on a single status; start_date (inclusive) and end_date
+    (exclusive) are local dates or datetimes and filter on created_at (UTC). Pass the returned cursor back in to get
+    the next page.
+    Returns: (rows, next_cursor); next_cursor is None on the last page
+    """
+    conditions = []
+    params = []
+    if status:
+        conditions.append('status = ?')
+        params.append(status)
+    if start_date:
+        conditions.append('created_at >= ?')
+        params.append(_utc_timestamp(start_date))
+    if end_date:
+        conditions.append('created_at < ?')
+        params.append(_utc_timestamp(end_date))
+    if cursor:
+        conditions.append('(created_at, id) < (?, ?)')
+        params.extend(cursor)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with db_connection() as conn:
+        rows = conn.execute(
+            f'SELECT * FROM news_posts {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+# Shortest term the trigram index can match; shorter terms are matched with LIKE
+SEARCH_MIN_TERM_LENGTH = 3
+# bm25 column weights: a hit in the headline counts more than one in the summary
+SEARCH_TITLE_WEIGHT = 4.0
+SEARCH_SUMMARY_WEIGHT = 1.0
+
+def _like_term(term):
+    """Case-insensitive substring match of one term against headline or summary."""
+    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return "(p.original_title LIKE ? ESCAPE '\\' OR p.summary_content LIKE ? ESCAPE '\\')", [pattern, pattern]
+
+def search_news(query, status=None, start_date=None, end_date=None, cursor=None, limit=20):
+    """
+    Full-text search over headlines and summaries. Every whitespace separated
+    term must match (as a substring); results are ranked by bm25 relevance.
+    status, start_date and end_date filter as in get_news_page.
+    Pass the returned cursor back in to get the next page.
+    Returns: (rows, next_cursor); next_cursor is None on the last page
+    """
+    terms = query.split()
+    if not terms:
+        return [], None
+    offset = cursor or 0
+
+    with db_connection() as conn:
+        has_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'news_posts_fts'"
+        ).fetchone()
+        indexed = [term for term in terms if has_index and len(term) >= SEARCH_MIN_TERM_LENGTH]
+
+        conditions = []
+        params = []
+        for term in terms:
+            if term not in indexed:
+                condition, term_params = _like_term(term)
+                conditions.append(condition)
+                params.extend(term_params)
+        if status:
+            conditions.append('p.status = ?')
+            params.append(status)
+        if start_date:
+            conditions.append('p.created_at >= ?')
+            params.append(_utc_timestamp(start_date))
+        if end_date:
+            conditions.append('p.created_at < ?')
+            params.append(_utc_timestamp(end_date))
+
+        if indexed:
+            # Quote each term so FTS5 query syntax in user input is matched literally
+            match = ' '.join('"' + term.replace('"', '""') + '"' for term in indexed)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            # Rank inside the index and only read the matching news_posts rows
+            rows = conn.execute(f'''
+            SELECT p.* FROM (
+                SELECT rowid, bm25(news_posts_fts, ?, ?) AS score FROM news_posts_fts WHERE news_posts_fts MATCH ?
+            ) f JOIN news_posts p ON p.id = f.rowid
+            {where}
+            ORDER BY f.score, p.id DESC LIMIT ? OFFSET ?
+            ''', [SEARCH_TITLE_WEIGHT, SEARCH_SUMMARY_WEIGHT, match] + params + [limit + 1, offset]).fetchall()
+        else:
+            # Only short terms, or no index: scan, newest first
+            rows = conn.execute(f'''
+            SELECT p.* FROM news_posts p WHERE {' AND '.join(conditions)}
+            ORDER BY p.created_at DESC, p.id DESC LIMIT ? OFFSET ?
+            ''', params + [limit + 1, offset]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = offset + limit
+    return rows, next_cursor
+
+# update_news_items field name -> news_posts column
+UPDATABLE_COLUMNS = {
+    "title": "original_title",
+    "summary": "summary_content",
+    "status": "status",
+}
+
+def update_news_items(updates):
+    """
+    Applies edits to many news items in one transaction.
+    `updates` maps item_id -> dict with any of 'title', 'summary', 'status';
+    fields set to None are left unchanged. Each chunk of rows is written with a
+    single multi-column, multi-row UPDATE using CASE expressions.
+    Returns the number of rows updated.
+    """
+    updates = {
+        item_id: {field: value for field, value in fields.items() if value is not None and field in UPDATABLE_COLUMNS}
+        for item_id, fields in updates.items()
+    }
+    updates = {item_id: fields for item_id, fields in updates.items() if fields}
+    if not updates:
+        return 0
+
+    # Each row binds at most 2 parameters per column plus its id
+    chunk_size = max(1, MAX_SQL_VARIABLES // (2 * len(UPDATABLE_COLUMNS) + 1))
+    item_ids = list(updates)
+    updated = 0
+    with db_connection() as conn:
+        for start in range(0, len(item_ids), chunk_size):
+            chunk = item_ids[start:start + chunk_size]
+            assignments = []
+            params = []
+            for field, column in UPDATABLE_COLUMNS.items():
+                cases = [(item_id, updates[item_id][field]) for item_id in chunk if field in updates[item_id]]
+                if not cases:
+                    continue
+                assignments.append(f"{column} = CASE id {' '.join('WHEN ? THEN ?' for _ in cases)} ELSE {column} END")
+                for item_id, value in cases:
+                    params.extend((item_id, value))
+            placeholders = ",".join("?" * len(chunk))
+            cursor = conn.execute(
+                f"UPDATE news_posts SET {', '.join(assignments)} WHERE id IN ({placeholders})",
+                params + chunk
+            )
+            updated += cursor.rowcount
+        # Posts waiting in the publish outbox go out with their latest summary
+        conn.executemany(
+            "UPDATE publish_outbox SET message = ? WHERE post_id = ? AND status IN ('queued', 'failed')",
+            [(fields['summary'], item_id) for item_id, fields in updates.items() if 'summary' in fields]
+        )
+    return updated
+
 def update_news_item(item_id, title=None, summary=None, status=None):
     """Updates an existing news item in the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if title:
-        cursor.execute('UPDATE news_posts SET original_title = ? WHERE id = ?', (title, item_id))
-    if summary:
-        cursor.execute('UPDATE news_posts SET summary_content = ? WHERE id = ?', (summary, item_id))
-    if status:
-        cursor.execute('UPDATE news_posts SET status = ? WHERE id = ?', (status, item_id))
-        
-    conn.commit()
-    conn.close()
+    # Empty values are ignored, as before
+    update_news_items({item_id: {"title": title or None, "summary": summary or None, "status": status or None}})
 
 def delete_news_item(item_id):
-    """Deletes a news item from the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM news_posts WHERE id = ?', (item_id,))
-    conn.commit()
-    conn.close()
+    """Deletes a news item from the database, cancelling any publish still queued for it."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # A batch already being sent cannot be recalled; its entry is left for the dispatcher to record
+        cursor.execute("DELETE FROM publish_outbox WHERE post_id = ? AND status != 'sending'", (item_id,))
+        cursor.execute('DELETE FROM news_posts WHERE id = ?', (item_id,))
 
 def get_metrics():
     """Returns counts for total, pending, and posted news items."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) FROM news_posts')
-    total = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM news_posts WHERE status = 'pending'")
-    pending = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM news_posts WHERE status = 'posted'")
-    posted = cursor.fetchone()[0]
-    
-    conn.close()
-    return total, pending, posted
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, total FROM news_status_counts')
+        counts = {row['status']: row['total'] for row in cursor.fetchall()}
+
+    return sum(counts.values()), counts.get('pending', 0), counts.get('posted', 0)
+
+def get_feed_cache(feed_url):
+    """Returns the cached validators and parsed entries for a feed, or None."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT etag, last_modified, entries_json FROM feed_cache WHERE feed_url = ?', (feed_url,))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return {
+        "etag": row['etag'],
+        "last_modified": row['last_modified'],
+        "entries": json.loads(row['entries_json'] or "[]"),
+    }
+
+def save_feed_cache(feed_url, etag, last_modified, entries):
+    """Stores the validators and parsed entries of a freshly downloaded feed."""
+    now = datetime.now()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO feed_cache (feed_url, etag, last_modified, entries_json, fetched_at, checked_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(feed_url) DO UPDATE SET
+            etag = excluded.etag,
+            last_modified = excluded.last_modified,
+            entries_json = excluded.entries_json,
+            fetched_at = excluded.fetched_at,
+            checked_at = excluded.checked_at
+        ''', (feed_url, etag, last_modified, json.dumps(entries, ensure_ascii=False), now, now))
+
+def touch_feed_cache(feed_url):
+    """Records that a feed was revalidated (304 Not Modified)."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE feed_cache SET checked_at = ? WHERE feed_url = ?', (datetime.now(), feed_url))
+
+def add_fingerprint(post_id, source_url, signature, buckets):
+    """Stores a story's MinHash signature and its LSH band buckets."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO story_fingerprints (post_id, source_url, signature) VALUES (?, ?, ?)
+        ''', (post_id, source_url, signature))
+        fingerprint_id = cursor.lastrowid
+        cursor.executemany(
+            'INSERT INTO story_fingerprint_bands (bucket, fingerprint_id) VALUES (?, ?)',
+            [(bucket, fingerprint_id) for bucket in buckets]
+        )
+
+def find_fingerprint_candidates(buckets):
+    """Returns (post_id, source_url, signature) rows sharing at least one LSH bucket."""
+    buckets = list(buckets)
+    placeholders = ",".join("?" * len(buckets))
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT f.post_id, f.source_url, f.signature FROM story_fingerprints f
+        WHERE f.id IN (SELECT fingerprint_id FROM story_fingerprint_bands WHERE bucket IN ({placeholders}))
+        ''', buckets)
+        rows = cursor.fetchall()
+    return rows
+
+def enqueue_job(auto_post=False, top_n=3):
+    """
+    Queues a workflow run. Returns the job id, or None if a run is already
+    queued or running (runs never overlap).
+    """
+    with db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        active = conn.execute("SELECT id FROM workflow_jobs WHERE status IN ('queued', 'running') LIMIT 1").fetchone()
+        if active:
+            return None
+        cursor = conn.execute(
+            'INSERT INTO workflow_jobs (auto_post, top_n) VALUES (?, ?)', (int(auto_post), top_n)
+        )
+        return cursor.lastrowid
+
+def claim_job(owner, lease_seconds):
+    """
+    Leases the oldest queued job that is due (past its retry delay), or a
+    running job whose lease has expired (its worker died).
+    Returns the job row, or None if there is nothing to do.
+    """
+    now = time.time()
+    with db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        job = conn.execute('''
+        SELECT * FROM workflow_jobs
+        WHERE (status = 'queued' AND (not_before IS NULL OR not_before <= ?))
+           OR (status = 'running' AND lease_expires_at < ?)
+        ORDER BY id LIMIT 1
+        ''', (now, now)).fetchone()
+        if not job:
+            return None
+        conn.execute('''
+        UPDATE workflow_jobs SET status = 'running', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+        WHERE id = ?
+        ''', (owner, now + lease_seconds, job['id']))
+        return conn.execute('SELECT * FROM workflow_jobs WHERE id = ?', (job['id'],)).fetchone()
+
+def renew_lease(job_id, owner, lease_seconds):
+    """Extends a job lease. Returns False if the lease was lost to another worker."""
+    with db_connection() as conn:
+        cursor = conn.execute('''
+        UPDATE workflow_jobs SET lease_expires_at = ?
+        WHERE id = ? AND lease_owner = ? AND status = 'running'
+        ''', (time.time() + lease_seconds, job_id, owner))
+        return cursor.rowcount == 1
+
+def finish_job(job_id, owner, status='done', error=None, not_before=None):
+    """
+    Marks a leased job as done or failed, or requeues it ('queued') to be
+    retried no earlier than not_before (epoch seconds), and releases the lease.
+    """
+    with db_connection() as conn:
+        conn.execute('''
+        UPDATE workflow_jobs SET status = ?, error = ?, finished_at = ?, not_before = ?,
+            lease_owner = NULL, lease_expires_at = NULL
+        WHERE id = ? AND lease_owner = ?
+        ''', (status, error, datetime.now(), not_before, job_id, owner))
+
+def save_selected_job_items(job_id, items):
+    """Checkpoints the selection step: stores the selected items and marks the job as selected."""
+    with db_connection() as conn:
+        conn.executemany('''
+        INSERT INTO workflow_job_items (job_id, source_url, stage, payload) VALUES (?, ?, 'selected', ?)
+        ON CONFLICT(job_id, source_url) DO NOTHING
+        ''', [(job_id, item['url'], json.dumps({"item": item}, ensure_ascii=False)) for item in items])
+        conn.execute('UPDATE workflow_jobs SET selected_at = ? WHERE id = ?', (datetime.now(), job_id))
+
+def update_job_item(job_item_id, stage, payload):
+    """Checkpoints one item after a stage completes."""
+    with db_connection() as conn:
+        conn.execute(
+            'UPDATE workflow_job_items SET stage = ?, payload = ?, updated_at = ? WHERE id = ?',
+            (stage, json.dumps(payload, ensure_ascii=False), datetime.now(), job_item_id)
+        )
+
+def get_job_items(job_id):
+    """Returns a job's item checkpoints as dicts with 'id', 'stage' and the decoded payload."""
+    with db_connection() as conn:
+        rows = conn.execute(
+            'SELECT id, stage, payload FROM workflow_job_items WHERE job_id = ? ORDER BY id', (job_id,)
+        ).fetchall()
+    return [{"id": row['id'], "stage": row['stage'], **json.loads(row['payload'])} for row in rows]
+
+def record_metric_samples(samples, expire_before):
+    """Appends (run_id, name, kind, value, created_at) samples and deletes those older than expire_before."""
+    with db_connection() as conn:
+        conn.executemany(
+            'INSERT INTO metric_samples (run_id, name, kind, value, created_at) VALUES (?, ?, ?, ?, ?)', samples
+        )
+        conn.execute('DELETE FROM metric_samples WHERE created_at < ?', (expire_before,))
+
+def get_metric_samples(last_runs=20):
+    """
+    Returns the samples of the most recent runs as
+    (run_id, name, kind, value, run_finished_at) tuples, newest run first.
+    """
+    with db_connection() as conn:
+        rows = conn.execute('''
+        WITH runs AS (
+            SELECT run_id, MAX(created_at) AS finished_at FROM metric_samples
+            WHERE run_id IS NOT NULL
+            GROUP BY run_id ORDER BY finished_at DESC LIMIT ?
+        )
+        SELECT s.run_id, s.name, s.kind, s.value, runs.finished_at
+        FROM metric_samples s JOIN runs ON s.run_id = runs.run_id
+        ORDER BY runs.finished_at DESC, s.id
+        ''', (last_runs,)).fetchall()
+    return [tuple(row) for row in rows]
+
+def enqueue_post(post_id, message, image_path):
+    """
+    Queues a post for publishing and marks it approved, in one transaction.
+    A post still waiting in the queue gets the new message; one whose earlier
+    publish failed is queued again.
+    Returns: True if the post is queued or being sent, False if it was already published
+    """
+    with db_connection() as conn:
+        return _enqueue_post(conn, post_id, message, image_path)
+
+def _enqueue_post(conn, post_id, message, image_path):
+    conn.execute('''
+    INSERT INTO publish_outbox (post_id, message, image_path, next_attempt_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(post_id) DO UPDATE SET
+        message = excluded.message, image_path = excluded.image_path, status = 'queued',
+        attempts = CASE publish_outbox.status WHEN 'failed' THEN 0 ELSE publish_outbox.attempts END,
+        next_attempt_at = CASE publish_outbox.status
+            WHEN 'failed' THEN excluded.next_attempt_at ELSE publish_outbox.next_attempt_at END,
+        error = CASE publish_outbox.status WHEN 'failed' THEN NULL ELSE publish_outbox.error END
+    WHERE publish_outbox.status IN ('queued', 'failed')
+    ''', (post_id, message, image_path, time.time()))
+    status = conn.execute('SELECT status FROM publish_outbox WHERE post_id = ?', (post_id,)).fetchone()[0]
+    if status == 'sent':
+        return False
+    conn.execute("UPDATE news_posts SET status = 'approved' WHERE id = ? AND status != 'posted'", (post_id,))
+    return True
+
+def claim_outbox(limit, lease_seconds):
+    """
+    Leases up to `limit` due outbox entries: queued ones whose retry time has
+    come, and ones left 'sending' by a dispatcher that died.
+    Returns: list of dicts with id, post_id, message, image_path and attempts
+    """
+    now = time.time()
+    with db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        # Entries whose post has been deleted are never sent
+        rows = conn.execute('''
+        SELECT o.id, o.post_id, o.message, o.image_path, o.attempts + 1 AS attempts
+        FROM publish_outbox o JOIN news_posts p ON p.id = o.post_id
+        WHERE (o.status = 'queued' AND o.next_attempt_at <= ?) OR (o.status = 'sending' AND o.lease_expires_at < ?)
+        ORDER BY o.next_attempt_at LIMIT ?
+        ''', (now, now, limit)).fetchall()
+        conn.executemany(
+            "UPDATE publish_outbox SET status = 'sending', attempts = attempts + 1, lease_expires_at = ? WHERE id = ?",
+            [(now + lease_seconds, row['id']) for row in rows]
+        )
+    return [dict(row) for row in rows]
+
+def mark_outbox_sent(sent):
+    """Records (outbox_id, fb_post_id) pairs as published and marks their posts 'posted'."""
+    with db_connection() as conn:
+        conn.executemany('''
+        UPDATE publish_outbox SET status = 'sent', fb_post_id = ?, sent_at = ?, lease_expires_at = NULL, error = NULL
+        WHERE id = ?
+        ''', [(fb_post_id, datetime.now(), outbox_id) for outbox_id, fb_post_id in sent])
+        conn.executemany(
+            "UPDATE news_posts SET status = 'posted' WHERE id = (SELECT post_id FROM publish_outbox WHERE id = ?)",
+            [(outbox_id,) for outbox_id, fb_post_id in sent]
+        )
+
+def mark_outbox_failed(failures):
+    """
+    Records (outbox_id, error, retry_at) failures. Entries with a retry_at
+    epoch are queued again for then; entries with None have given up.
+    """
+    with db_connection() as conn:
+        conn.executemany('''
+        UPDATE publish_outbox SET status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'queued' END,
+            next_attempt_at = COALESCE(?, next_attempt_at), error = ?, lease_expires_at = NULL
+        WHERE id = ?
+        ''', [(retry_at, retry_at, error, outbox_id) for outbox_id, error, retry_at in failures])
+
+def get_outbox_status(post_ids):
+    """Returns {post_id: (status, error)} for the posts' outbox entries."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    placeholders = ",".join("?" * len(post_ids))
+    with db_connection() as conn:
+        rows = conn.execute(
+            f'SELECT post_id, status, error FROM publish_outbox WHERE post_id IN ({placeholders})', post_ids
+        ).fetchall()
+    return {row['post_id']: (row['status'], row['error']) for row in rows}
+
+def get_outbox_counts():
+    """Returns {status: count} for the publish outbox."""
+    with db_connection() as conn:
+        rows = conn.execute('SELECT status, COUNT(*) FROM publish_outbox GROUP BY status').fetchall()
+    return {status: count for status, count in rows}
+
+def _archive_suffix():
+    return ".jsonl.zst" if zstandard else ".jsonl.gz"
+
+def _write_archive_part(path, records):
+    """Writes records as one compressed JSONL file (via a temp file, so a part is never half-written)."""
+    data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records).encode("utf-8")
+    if zstandard:
+        data = zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(data)
+    else:
+        data = gzip.compress(data)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _zip_member(path):
+    """Zip member name for an image path (relative, forward slashes)."""
+    path = os.path.splitdrive(os.path.normpath(path))[1]
+    return path.replace(os.sep, "/").lstrip("/")
+
+def _archive_images(month, records):
+    """
+    Copies the posts' local image files into the month's zip and notes the
+    zip in each record. Returns the set of archived file paths.
+    """
+    paths = {
+        path for record in records for path in (record['image_path'], record['thumbnail_path'])
+        if path and os.path.isfile(path)
+    }
+    if not paths:
+        return set()
+
+    zip_name = os.path.join("images", f"{month}.zip")
+    zip_path = os.path.join(ARCHIVE_DIR, zip_name)
+    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+    with zipfile.ZipFile(zip_path, "a", compression=zipfile.ZIP_DEFLATED) as archive:
+        stored = set(archive.namelist())
+        for path in sorted(paths):
+            member = _zip_member(path)
+            if member not in stored:
+                archive.write(path, member)
+    for record in records:
+        if record['image_path'] in paths or record['thumbnail_path'] in paths:
+            record['image_archive'] = zip_name
+    return paths
+
+def archive_old_posts(older_than_days=ARCHIVE_AFTER_DAYS, vacuum=True):
+    """
+    Moves posts created more than older_than_days ago out of SQLite: rows go
+    to ARCHIVE_DIR/posts/<YYYY-MM>/ as compressed JSONL parts, their images
+    into ARCHIVE_DIR/images/<YYYY-MM>.zip. Posts still waiting in the publish
+    outbox stay; approved posts whose publishing gave up are archived. Each record keeps its Facebook post id and
+    publish time. Rows are deleted, with their outbox entries and dedup
+    fingerprints, only after their archive files are on disk; the database is
+    vacuumed afterwards to return space.
+    Returns: number of posts archived
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    archived = 0
+    archived_paths = set()
+
+    while True:
+        with db_connection() as conn:
+            rows = conn.execute('''
+            SELECT p.*, o.fb_post_id, o.sent_at AS fb_posted_at
+            FROM news_posts p LEFT JOIN publish_outbox o ON o.post_id = p.id
+            WHERE p.created_at < ?
+              AND NOT (p.status = 'approved' AND COALESCE(o.status, '') IN ('queued', 'sending'))
+            ORDER BY p.created_at, p.id LIMIT ?
+            ''', (_utc_timestamp(cutoff), ARCHIVE_BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(str(row['created_at'])[:7], []).append(dict(row))
+        for month, records in by_month.items():
+            archived_paths |= _archive_images(month, records)
+            part = f"part-{run_id}-{records[0]['id']}{_archive_suffix()}"
+            _write_archive_part(os.path.join(ARCHIVE_DIR, "posts", month, part), records)
+
+        ids = [(row['id'],) for row in rows]
+        with db_connection() as conn:
+            conn.executemany('DELETE FROM publish_outbox WHERE post_id = ?', ids)
+            # Stories this old no longer turn up in feeds, so their dedup fingerprints can go too
+            conn.executemany('''
+            DELETE FROM story_fingerprint_bands
+            WHERE fingerprint_id IN (SELECT id FROM story_fingerprints WHERE post_id = ?)
+            ''', ids)
+            conn.executemany('DELETE FROM story_fingerprints WHERE post_id = ?', ids)
+            conn.executemany('DELETE FROM news_posts WHERE id = ?', ids)
+        archived += len(rows)
+
+    if not archived:
+        return 0
+
+    # Image files can be shared by posts with the same source image and headline
+    referenced = get_referenced_image_paths()
+    for path in archived_paths - referenced:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error removing archived image {path}: {e}")
+
+    with db_connection() as conn:
+        conn.execute(
+            "DELETE FROM workflow_jobs WHERE status IN ('done', 'failed') AND created_at < ?", (_utc_timestamp(cutoff),)
+        )
+        conn.execute(
+            'DELETE FROM workflow_job_items WHERE job_id NOT IN (SELECT id FROM workflow_jobs)'
+        )
+
+    if vacuum:
+        conn = get_db_connection()
+        try:
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+    return archived
+
+def list_archive_months():
+    """Returns the archived months (YYYY-MM), newest first."""
+    posts_dir = os.path.join(ARCHIVE_DIR, "posts")
+    if not os.path.isdir(posts_dir):
+        return []
+    return sorted(os.listdir(posts_dir), reverse=True)
+
+def _read_archive_part(path):
+    """Yields the records of one archive part, decompressing as it streams."""
+    if path.endswith(".zst"):
+        if not zstandard:
+            raise RuntimeError(f"{path} needs the zstandard package")
+        with open(path, "rb") as raw:
+            with zstandard.ZstdDecompressor().stream_reader(raw) as reader:
+                for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                    yield json.loads(line)
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as lines:
+            for line in lines:
+                yield json.loads(line)
+
+def iter_archived_posts(query=None, months=None):
+    """
+    Streams archived posts, newest month first, without loading whole files.
+    query keeps posts whose headline or summary contains it (case-insensitive);
+    months limits the scan to the given YYYY-MM partitions.
+    Yields: post dicts (news_posts columns plus 'image_archive', 'fb_post_id'
+    and 'fb_posted_at')
+    """
+    needle = query.lower() if query else None
+    for month in months or list_archive_months():
+        month_dir = os.path.join(ARCHIVE_DIR, "posts", month)
+        if not os.path.isdir(month_dir):
+            continue
+        for name in sorted(os.listdir(month_dir), reverse=True):
+            if not name.endswith((".jsonl.zst", ".jsonl.gz")):
+                continue
+            for record in _read_archive_part(os.path.join(month_dir, name)):
+                text = f"{record.get('original_title') or ''}\n{record.get('summary_content') or ''}".lower()
+                if needle is None or needle in text:
+                    yield record
+
+def read_archived_image(image_archive, image_path):
+    """Returns the bytes of an archived image, or None if it is not in the archive."""
+    try:
+        with zipfile.ZipFile(os.path.join(ARCHIVE_DIR, image_archive)) as archive:
+            return archive.read(_zip_member(image_path))
+    except (OSError, KeyError):
+        return None
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,107 @@
+import re
+import random
+import struct
+import hashlib
+import db_manager
+
+# --- Constants ---
+# MinHash signature of NUM_PERM values, split into BANDS bands of ROWS values
+# for locality-sensitive hashing. Stories sharing any band bucket become
+# candidates; candidates are confirmed by estimated Jaccard similarity.
+# 16 bands of 4 rows put the candidate threshold, (1/BANDS) ** (1/ROWS), at
+# SIMILARITY_THRESHOLD, so unrelated stories rarely need to be compared.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = 0.5
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "to", "was", "were",
+    "will", "with", "after", "over", "new", "says", "said",
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)  # fixed seed: signatures must be stable across runs
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _hash(data, size=8):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=size).digest(), "big")
+
+def shingles(text):
+    """Returns the set of lower-cased words in a text, minus stopwords."""
+    return {w for w in _TOKEN_RE.findall(text.lower()) if w not in STOPWORDS}
+
+def minhash(text):
+    """Computes the MinHash signature (list of NUM_PERM ints) of a text."""
+    hashes = [_hash(token.encode("utf-8"), 4) for token in shingles(text)]
+    if not hashes:
+        return [_MERSENNE_PRIME] * NUM_PERM
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+def similarity(sig_a, sig_b):
+    """Estimates the Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+def band_buckets(signature):
+    """Hashes each band of a signature into a signed 64-bit bucket id."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        data = struct.pack(f">I{ROWS}Q", band, *rows)
+        buckets.append(_hash(data) - (1 << 63))  # SQLite integers are signed
+    return buckets
+
+def pack_signature(signature):
+    return struct.pack(f">{NUM_PERM}Q", *signature)
+
+def unpack_signature(blob):
+    return list(struct.unpack(f">{NUM_PERM}Q", blob))
+
+def story_signature(news_item):
+    """Fingerprints a news item from its title and cleaned summary."""
+    return minhash(f"{news_item['title']} {news_item['summary']}")
+
+def find_near_duplicate(signature, threshold=SIMILARITY_THRESHOLD):
+    """Returns the most similar stored (post_id, source_url), or None."""
+    best = None
+    for row in db_manager.find_fingerprint_candidates(band_buckets(signature)):
+        score = similarity(signature, unpack_signature(row['signature']))
+        if score >= threshold and (best is None or score > best[0]):
+            best = (score, row['post_id'], row['source_url'])
+    return best[1:] if best else None
+
+class NearDuplicateFilter:
+    """
+    Stateful near-duplicate check for one ingestion cycle: remembers the
+    stories it has accepted so later copies in the same cycle are dropped too.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.batch_index = {}  # bucket -> signatures accepted in this cycle
+
+    def accept(self, item):
+        """Returns True (and remembers the item) unless it duplicates a stored or accepted story."""
+        signature = story_signature(item)
+        buckets = band_buckets(signature)
+
+        in_batch = any(
+            similarity(signature, other) >= self.threshold
+            for bucket in buckets for other in self.batch_index.get(bucket, ())
+        )
+        if in_batch or find_near_duplicate(signature, self.threshold):
+            print(f"Skipping near-duplicate: {item['title']}")
+            return False
+
+        for bucket in buckets:
+            self.batch_index.setdefault(bucket, []).append(signature)
+        item['minhash'] = signature
+        return True
+
+def record_story(news_item, post_id):
+    """Adds a stored story's signature to the persistent LSH index."""
+    signature = news_item.get('minhash') or story_signature(news_item)
+    db_manager.add_fingerprint(post_id, news_item['url'], pack_signature(signature), band_buckets(signature))
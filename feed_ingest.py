@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import calendar
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+import feedparser
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+import db_manager
+import metrics
+
+load_dotenv()
+
+# --- Constants ---
+FEEDS_FILE = os.getenv("FEEDS_FILE", "feeds.json")
+MAX_WORKERS = int(os.getenv("FEED_MAX_WORKERS", "16"))
+MAX_PER_HOST = int(os.getenv("FEED_MAX_PER_HOST", "2"))
+FETCH_TIMEOUT = 15
+PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/1024x1024?text=News+Image"
+
+# Default feed registry. Override by creating feeds.json (same shape) or
+# pointing FEEDS_FILE at another JSON file.
+DEFAULT_FEEDS = [
+    {"name": "Cointelegraph", "url": "https://cointelegraph.com/rss", "category": "crypto", "limit": 10},
+]
+
+_host_locks = {}
+_host_locks_guard = threading.Lock()
+_thread_local = threading.local()
+
+
+def clean_html(html_content):
+    """Removes HTML tags from the string."""
+    soup = BeautifulSoup(html_content, "html.parser")
+    return soup.get_text(separator=" ", strip=True)
+
+def load_feed_registry(path=None):
+    """
+    Loads the feed registry from a JSON file.
+    Each feed is a dict with 'url' and optional 'name', 'category', 'limit' and 'enabled'.
+    Falls back to DEFAULT_FEEDS when the file does not exist.
+    """
+    path = path or FEEDS_FILE
+    feeds = DEFAULT_FEEDS
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                feeds = json.load(f)
+        except Exception as e:
+            print(f"Error reading feed registry {path}: {e}")
+
+    return [feed for feed in feeds if feed.get("url") and feed.get("enabled", True)]
+
+def _get_session():
+    """Returns a requests session local to the current worker thread."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers["User-Agent"] = "NewsAutomationDashboard/1.0 (+feedparser)"
+        _thread_local.session = session
+    return session
+
+def _host_lock(url):
+    """Returns the semaphore limiting concurrent connections to the url's host."""
+    host = urllib.parse.urlparse(url).netloc.lower()
+    with _host_locks_guard:
+        if host not in _host_locks:
+            _host_locks[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_locks[host]
+
+def _entry_timestamp(entry):
+    """Returns the entry's publish time as a UTC epoch, or 0 if unknown."""
+    parsed = entry.get("published_parsed") or entry.get("updated_parsed")
+    return calendar.timegm(parsed) if parsed else 0
+
+def _entry_to_item(entry, feed):
+    """Converts a feedparser entry into a news item dict."""
+    # Try to find an existing image or use placeholder
+    image_url = PLACEHOLDER_IMAGE_URL
+
+    if 'media_content' in entry:
+        image_url = entry.media_content[0]['url']
+    elif 'links' in entry:
+        for link in entry.links:
+            if link.get('type') in ['image/jpeg', 'image/png']:
+                image_url = link['href']
+                break
+
+    return {
+        "title": entry.get("title", ""),
+        "url": entry.get("link", ""),
+        "summary": clean_html(entry.get("summary", "")),
+        "published": entry.get("published", ""),
+        "published_ts": _entry_timestamp(entry),
+        "image_url": image_url,
+        "feed": feed.get("name", feed["url"]),
+        "category": feed.get("category"),
+    }
+
+def fetch_feed(feed):
+    """
+    Downloads and parses a single feed. Returns a list of news item dicts.
+    Sends a conditional GET using the cached ETag/Last-Modified validators and
+    reuses the cached entries without re-parsing when the server answers 304.
+    """
+    url = feed["url"]
+    limit = feed.get("limit", 10)
+    cached = db_manager.get_feed_cache(url)
+
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    with _host_lock(url), metrics.span("feed_fetch"):
+        metrics.increment("feed_request")
+        response = _get_session().get(url, headers=headers, timeout=FETCH_TIMEOUT)
+
+    if response.status_code == 304 and cached:
+        metrics.increment("feed_not_modified")
+        db_manager.touch_feed_cache(url)
+        return cached["entries"][:limit]
+
+    response.raise_for_status()
+
+    parsed = feedparser.parse(response.content)
+    if parsed.bozo and not parsed.entries:
+        raise ValueError(f"Error parsing RSS feed: {parsed.bozo_exception}")
+
+    # Cache everything the feed returned so a later limit change still works on a 304
+    items = [_entry_to_item(entry, feed) for entry in parsed.entries]
+    db_manager.save_feed_cache(
+        url,
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+        items,
+    )
+    return items[:limit]
+
+def iter_feeds(feeds=None):
+    """
+    Fetches all feeds concurrently and yields (feed, items) as each one completes.
+    Feeds that fail are reported and skipped.
+    """
+    feeds = load_feed_registry() if feeds is None else feeds
+    if not feeds:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(feeds))) as executor:
+        fetch = metrics.in_current_run(fetch_feed)
+        futures = {executor.submit(fetch, feed): feed for feed in feeds}
+        for future in as_completed(futures):
+            feed = futures[future]
+            try:
+                yield feed, future.result()
+            except Exception as e:
+                print(f"Error fetching feed {feed['url']}: {e}")
+
+def fetch_all_feeds(feeds=None):
+    """
+    Fetches all registered feeds concurrently.
+    Returns: one list of news items merged across feeds, newest first.
+    """
+    feeds = load_feed_registry() if feeds is None else feeds
+    start = time.monotonic()
+    items = []
+    feed_count = 0
+    for feed, feed_items in iter_feeds(feeds):
+        feed_count += 1
+        items.extend(feed_items)
+
+    items.sort(key=lambda item: item["published_ts"], reverse=True)
+    print(f"Fetched {feed_count}/{len(feeds)} feeds in {time.monotonic() - start:.1f}s.")
+    return items
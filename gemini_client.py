@@ -0,0 +1,137 @@
+import os
+import time
+import random
+import threading
+import google.generativeai as genai
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+# --- Constants ---
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Defaults match the Gemini free tier; raise them in .env for a paid quota.
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+EXPECTED_OUTPUT_TOKENS = 1024
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+
+if GEMINI_API_KEY:
+    genai.configure(api_key=GEMINI_API_KEY)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Blocks until `amount` tokens are available, then takes them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount):
+        """Corrects an earlier estimate; a positive amount takes extra tokens (may go negative)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def _is_rate_limit_error(error):
+    """Returns True for HTTP 429 / quota exhausted errors from the Gemini API."""
+    if getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted":
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+def estimate_tokens(prompt):
+    """Rough token estimate for a prompt (Thai text tokenizes denser than English)."""
+    return len(str(prompt)) // 3 + EXPECTED_OUTPUT_TOKENS
+
+
+class GeminiClient:
+    """
+    Shared Gemini access layer: requests-per-minute and tokens-per-minute
+    token buckets, bounded concurrency and exponential backoff on 429.
+    """
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 max_retries=GEMINI_MAX_RETRIES):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._models = {}
+        self._models_lock = threading.Lock()
+
+    def _model(self, model_name):
+        with self._models_lock:
+            if model_name not in self._models:
+                self._models[model_name] = genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def generate_content(self, model_name, prompt, **kwargs):
+        """Calls model.generate_content within the configured rate limits."""
+        model = self._model(model_name)
+        estimated = estimate_tokens(prompt)
+
+        for attempt in range(self.max_retries + 1):
+            self.requests.acquire()
+            self.tokens.acquire(estimated)
+            try:
+                with self.slots, metrics.span("gemini_request"):
+                    metrics.increment("gemini_request")
+                    response = model.generate_content(prompt, **kwargs)
+            except Exception as e:
+                if _is_rate_limit_error(e):
+                    metrics.increment("gemini_rate_limited")
+                if not _is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+                delay += random.uniform(0, delay / 2)
+                print(f"Gemini rate limited (attempt {attempt + 1}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            usage = getattr(response, "usage_metadata", None)
+            actual = getattr(usage, "total_token_count", None)
+            if actual:
+                self.tokens.adjust(actual - estimated)
+            return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Returns the process-wide GeminiClient."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient()
+        return _client
+
+def generate_content(model_name, prompt, **kwargs):
+    """Shortcut for get_client().generate_content(...)."""
+    return get_client().generate_content(model_name, prompt, **kwargs)
@@ -1,13 +1,55 @@
 import os
 import io
+import json
+import time
+import atexit
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import requests
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import google.generativeai as genai
 from dotenv import load_dotenv
+import gemini_client
+import metrics
+import text_layout
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "8"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+# Cached images younger than this are used without contacting the server
+IMAGE_CACHE_FRESH_SECONDS = int(os.getenv("IMAGE_CACHE_FRESH_SECONDS", str(24 * 3600)))
+
+GENERATED_IMAGES_DIR = "generated_images"
+THUMBNAILS_DIR = os.path.join(GENERATED_IMAGES_DIR, "thumbs")
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 75
+
+# Branded image template. Every value here is part of the output file digest,
+# so changing one produces new files instead of reusing stale renders.
+# Bump RENDER_TEMPLATE_VERSION when changing the drawing code itself.
+RENDER_TEMPLATE_VERSION = 1
+IMAGE_SIZE = 1024
+GRADIENT_HEIGHT_RATIO = 0.35
+HEADLINE_FONT_SIZE = 48
+# Long headlines shrink down to this size to fit in HEADLINE_MAX_LINES lines
+HEADLINE_MIN_FONT_SIZE = 32
+HEADLINE_MAX_LINES = 3
+HEADLINE_MAX_WIDTH = 900
+HEADLINE_LINE_HEIGHT = 60
+HEADLINE_BOTTOM_MARGIN = 120
+JPEG_QUALITY = 90
+
+# Common Thai fonts, tried in order
+FONT_PATHS = [
+    "/System/Library/Fonts/Supplemental/Thonburi.ttc",  # macOS
+    "/usr/share/fonts/truetype/noto/NotoSansThai-Regular.ttf",  # Linux
+    "C:\\Windows\\Fonts\\leelawad.ttf",  # Windows
+]
 
 def generate_image_with_gemini(prompt, size=1024):
     """
@@ -23,8 +65,7 @@ def generate_image_with_gemini(prompt, size=1024):
         # For now, we'll use a fallback approach
         
         # Attempt to generate (this may not work with current API)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp-image-generation')
-        response = model.generate_content(prompt)
+        response = gemini_client.generate_content('gemini-2.0-flash-exp-image-generation', prompt)
         
         # If successful, return image data
         # This is speculative based on future API support
@@ -34,130 +75,387 @@ def generate_image_with_gemini(prompt, size=1024):
         print(f"Gemini image generation error: {e}")
         return None
 
+_thread_local = threading.local()
+_cache_lock = threading.Lock()
+
+def _get_session():
+    """Returns a pooled requests session local to the current thread."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _thread_local.session = session
+    return session
+
+def _cache_paths(image_url):
+    key = hashlib.sha256(image_url.encode("utf-8")).hexdigest()
+    base = os.path.join(IMAGE_CACHE_DIR, key)
+    return base + ".img", base + ".json"
+
+def _read_cache(image_url):
+    """Returns (image_bytes, metadata) from the on-disk cache, or (None, None)."""
+    data_path, meta_path = _cache_paths(image_url)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(data_path, "rb") as f:
+            return f.read(), meta
+    except (OSError, ValueError):
+        return None, None
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _write_cache(image_url, image_bytes, response):
+    data_path, meta_path = _cache_paths(image_url)
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(image_bytes)
+    os.replace(tmp_path, data_path)
+    _write_meta(meta_path, {
+        "url": image_url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "validated_at": time.time(),
+    })
+    _evict_cache()
+
+def _touch(path):
+    """Marks a cache entry as recently used (LRU order is file mtime)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _evict_cache():
+    """Deletes least recently used cache entries until the cache fits IMAGE_CACHE_MAX_BYTES."""
+    with _cache_lock:
+        entries = []
+        total = 0
+        for entry in os.scandir(IMAGE_CACHE_DIR):
+            if entry.name.endswith(".img"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= IMAGE_CACHE_MAX_BYTES:
+            return
+
+        for _, size, data_path in sorted(entries):
+            if total <= IMAGE_CACHE_MAX_BYTES:
+                break
+            for path in (data_path, data_path[:-len(".img")] + ".json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+def download_image_bytes(image_url):
+    """
+    Downloads an image from URL and returns the raw bytes, or None on failure.
+    Images are cached on disk by URL: fresh entries skip the network, older
+    ones are revalidated with If-None-Match/If-Modified-Since, and a cached
+    copy is served if the server cannot be reached.
+    """
+    cached_bytes, meta = _read_cache(image_url)
+    data_path, meta_path = _cache_paths(image_url)
+    if cached_bytes is not None and time.time() - meta.get("validated_at", 0) < IMAGE_CACHE_FRESH_SECONDS:
+        _touch(data_path)
+        metrics.increment("image_cache_hit")
+        return cached_bytes
+
+    headers = {}
+    if cached_bytes is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with metrics.span("image_download"):
+            metrics.increment("image_request")
+            response = _get_session().get(image_url, headers=headers, timeout=10)
+        if response.status_code == 304 and cached_bytes is not None:
+            meta["validated_at"] = time.time()
+            _write_meta(meta_path, meta)
+            _touch(data_path)
+            return cached_bytes
+        response.raise_for_status()
+    except Exception as e:
+        if cached_bytes is not None:
+            print(f"Error revalidating image, using cached copy: {e}")
+            return cached_bytes
+        print(f"Error downloading image: {e}")
+        return None
+
+    try:
+        _write_cache(image_url, response.content, response)
+    except OSError as e:
+        print(f"Error caching image: {e}")
+    return response.content
+
 def download_image(image_url):
     """Downloads an image from URL and returns PIL Image object."""
+    image_bytes = download_image_bytes(image_url)
+    if image_bytes is None:
+        return None
     try:
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        img = Image.open(io.BytesIO(response.content))
+        img = Image.open(io.BytesIO(image_bytes))
         return img.convert('RGB')
     except Exception as e:
-        print(f"Error downloading image: {e}")
+        print(f"Error decoding image: {e}")
         return None
 
+@lru_cache(maxsize=16)
 def create_gradient_overlay(size, gradient_height_ratio=0.4):
-    """Creates a gradient overlay (black to transparent) for text background."""
+    """
+    Creates a gradient overlay (black to transparent) for text background.
+    The alpha ramp is built as one column and stretched, and results are cached
+    per size and ratio. Treat the returned image as read-only.
+    """
     width, height = size
     gradient_height = int(height * gradient_height_ratio)
     
-    # Create gradient from transparent to black
-    gradient = Image.new('RGBA', (width, gradient_height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(gradient)
+    # Alpha goes from transparent to 200 (max 200 for semi-transparency)
+    ramp = bytes(int((y / gradient_height) * 200) for y in range(gradient_height))
+    alpha = Image.frombytes('L', (1, gradient_height), ramp).resize((width, gradient_height), Image.Resampling.NEAREST)
     
-    for y in range(gradient_height):
-        alpha = int((y / gradient_height) * 200)  # Max 200 for semi-transparency
-        draw.rectangle([(0, y), (width, y + 1)], fill=(0, 0, 0, alpha))
+    gradient = Image.new('RGBA', (width, gradient_height), (0, 0, 0, 0))
+    gradient.putalpha(alpha)
     
     return gradient
 
+@lru_cache(maxsize=None)
+def find_font_path():
+    """Returns the first installed Thai font from FONT_PATHS, or None."""
+    for font_path in FONT_PATHS:
+        if os.path.exists(font_path):
+            return font_path
+    return None
+
+@lru_cache(maxsize=32)
+def load_font(font_size):
+    """Loads (and caches) the Thai font at the given size, falling back to Pillow's default."""
+    font_path = find_font_path()
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, font_size)
+        except Exception:
+            pass
+    return ImageFont.load_default()
+
 def add_headline_to_image(image_url, headline_text, output_path=None):
     """
     Downloads image, adds gradient overlay, and overlays Thai headline text.
     Returns path to the processed image.
     """
     # Download image
-    img = download_image(image_url)
-    if not img:
+    image_bytes = download_image_bytes(image_url)
+    if image_bytes is None:
         return None
     
-    # Resize to 1024x1024 if needed
-    img = img.resize((1024, 1024), Image.Resampling.LANCZOS)
+    return render_headline_image(image_bytes, headline_text, output_path)
+
+def render_digest(image_bytes, headline_text):
+    """
+    Stable digest of everything that determines a render: source image bytes,
+    headline, font and template parameters.
+    """
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(image_bytes).digest())
+    template = [
+        RENDER_TEMPLATE_VERSION, IMAGE_SIZE, GRADIENT_HEIGHT_RATIO, HEADLINE_FONT_SIZE,
+        HEADLINE_MIN_FONT_SIZE, HEADLINE_MAX_LINES, HEADLINE_MAX_WIDTH, HEADLINE_LINE_HEIGHT,
+        HEADLINE_BOTTOM_MARGIN, JPEG_QUALITY, text_layout.LAYOUT_VERSION, text_layout.SEGMENTER,
+        find_font_path(), headline_text,
+    ]
+    digest.update(json.dumps(template, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+def output_path_for(image_bytes, headline_text):
+    """Returns the content-addressed output path for a render."""
+    return os.path.join(GENERATED_IMAGES_DIR, f"news_{render_digest(image_bytes, headline_text)[:32]}.jpg")
+
+def render_headline_image(image_bytes, headline_text, output_path=None):
+    """
+    Renders the branded image from downloaded image bytes: resize, gradient
+    overlay and Thai headline. Runs in render worker processes.
+    Without an explicit output_path the file is named by render_digest, and
+    rendering is skipped when that file already exists.
+    Returns path to the processed image.
+    """
+    if not output_path:
+        output_path = output_path_for(image_bytes, headline_text)
+        if os.path.exists(output_path):
+            if not os.path.exists(thumbnail_path_for(output_path)):
+                ensure_thumbnail(output_path)
+            return output_path
+    
+    img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    
+    # Resize to IMAGE_SIZE x IMAGE_SIZE if needed
+    img = img.resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
     
     # Create RGBA version for overlay
     img = img.convert('RGBA')
     
     # Create gradient overlay
-    gradient = create_gradient_overlay((1024, 1024), gradient_height_ratio=0.35)
+    gradient = create_gradient_overlay((IMAGE_SIZE, IMAGE_SIZE), gradient_height_ratio=GRADIENT_HEIGHT_RATIO)
     
     # Position gradient at bottom
-    gradient_position = (0, 1024 - gradient.size[1])
+    gradient_position = (0, IMAGE_SIZE - gradient.size[1])
     img.paste(gradient, gradient_position, gradient)
     
     # Add text
     draw = ImageDraw.Draw(img)
     
-    # Try to load a Thai font
-    font_size = 48
-    try:
-        # Try common Thai fonts
-        font_paths = [
-            "/System/Library/Fonts/Supplemental/Thonburi.ttc",  # macOS
-            "/usr/share/fonts/truetype/noto/NotoSansThai-Regular.ttf",  # Linux
-            "C:\\Windows\\Fonts\\leelawad.ttf",  # Windows
-        ]
-        
-        font = None
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                try:
-                    font = ImageFont.truetype(font_path, font_size)
-                    break
-                except:
-                    continue
-        
-        if not font:
-            # Fallback to default
-            font = ImageFont.load_default()
-    except:
-        font = ImageFont.load_default()
-    
-    # Calculate text position (center bottom)
-    # Wrap text if too long
-    max_width = 900
-    lines = []
-    words = headline_text.split()
-    current_line = ""
-    
-    for word in words:
-        test_line = current_line + " " + word if current_line else word
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        if bbox[2] - bbox[0] <= max_width:
-            current_line = test_line
-        else:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
-    
-    if current_line:
-        lines.append(current_line)
+    # Wrap the headline (Thai-aware), shrinking the font if it needs too many lines
+    font, font_size, lines = text_layout.fit_text(
+        headline_text, load_font, HEADLINE_MAX_WIDTH, HEADLINE_MAX_LINES,
+        HEADLINE_FONT_SIZE, HEADLINE_MIN_FONT_SIZE
+    )
+    line_height = round(HEADLINE_LINE_HEIGHT * font_size / HEADLINE_FONT_SIZE)
     
-    # Draw each line
-    y_position = 1024 - 120 - (len(lines) * 60)
+    # Draw each line, centered at the bottom
+    y_position = IMAGE_SIZE - HEADLINE_BOTTOM_MARGIN - (len(lines) * line_height)
     
     for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font)
-        text_width = bbox[2] - bbox[0]
-        x_position = (1024 - text_width) // 2
+        text_width = text_layout.measure(font, line)
+        x_position = int((IMAGE_SIZE - text_width) // 2)
         
         # Draw text with shadow for better readability
         draw.text((x_position + 2, y_position + 2), line, font=font, fill=(0, 0, 0, 255))
         draw.text((x_position, y_position), line, font=font, fill=(255, 255, 255, 255))
         
-        y_position += 60
+        y_position += line_height
     
     # Convert back to RGB
     final_img = Image.new('RGB', img.size, (255, 255, 255))
     final_img.paste(img, mask=img.split()[3])  # Use alpha channel as mask
     
-    # Save image
-    if not output_path:
-        output_path = f"generated_images/news_{hash(headline_text)}.jpg"
+    # Save image (write then rename, so a half-written file is never reused)
+    os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else GENERATED_IMAGES_DIR, exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    final_img.save(tmp_path, "JPEG", quality=JPEG_QUALITY)
+    os.replace(tmp_path, output_path)
     
-    os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else "generated_images", exist_ok=True)
-    final_img.save(output_path, "JPEG", quality=90)
+    # Dashboard thumbnail, made from the in-memory render
+    save_thumbnail(final_img, thumbnail_path_for(output_path))
     
     return output_path
 
+def thumbnail_path_for(image_path):
+    """Returns the thumbnail path for a local image path or a remote image URL."""
+    if image_path.startswith(("http://", "https://")):
+        stem = "url_" + hashlib.sha256(image_path.encode("utf-8")).hexdigest()[:32]
+    else:
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(THUMBNAILS_DIR, f"{stem}.webp")
+
+def save_thumbnail(img, thumbnail_path):
+    """Writes a small WebP thumbnail of a PIL image."""
+    thumb = img.convert('RGB')
+    thumb.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    tmp_path = f"{thumbnail_path}.{os.getpid()}.tmp"
+    thumb.save(tmp_path, "WEBP", quality=THUMBNAIL_QUALITY)
+    os.replace(tmp_path, thumbnail_path)
+    return thumbnail_path
+
+def ensure_thumbnail(image_path):
+    """
+    Returns the thumbnail for a stored image, creating it if needed (lazy
+    backfill for posts rendered before thumbnails existed). Remote URLs are
+    fetched through the image cache. Returns None if the image is unavailable.
+    """
+    if not image_path:
+        return None
+    thumbnail_path = thumbnail_path_for(image_path)
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path
+
+    try:
+        if image_path.startswith(("http://", "https://")):
+            image_bytes = download_image_bytes(image_path)
+            if image_bytes is None:
+                return None
+            img = Image.open(io.BytesIO(image_bytes))
+        elif os.path.exists(image_path):
+            img = Image.open(image_path)
+        else:
+            return None
+        return save_thumbnail(img, thumbnail_path)
+    except Exception as e:
+        print(f"Error creating thumbnail for {image_path}: {e}")
+        return None
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def _get_render_pool():
+    """Returns the shared render process pool, created on first use."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            try:
+                _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+            except (OSError, NotImplementedError) as e:
+                # Platforms without working multiprocessing fall back to threads
+                print(f"Process pool unavailable ({e}), rendering in threads")
+                _render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+            atexit.register(_render_pool.shutdown)
+        return _render_pool
+
+def render_image(image_url, headline_text, output_path=None):
+    """
+    Downloads (through the image cache) and renders one branded image in the
+    render process pool, blocking until it is done.
+    Returns path to the processed image, or None if the download failed.
+    """
+    image_bytes = download_image_bytes(image_url)
+    if image_bytes is None:
+        return None
+    if not output_path:
+        output_path = output_path_for(image_bytes, headline_text)
+        if os.path.exists(output_path):
+            return output_path
+    with metrics.span("image_render"):
+        return _get_render_pool().submit(render_headline_image, image_bytes, headline_text, output_path).result()
+
+def collect_garbage(referenced_paths, min_age_seconds=3600):
+    """
+    Deletes files in GENERATED_IMAGES_DIR and THUMBNAILS_DIR that are not in referenced_paths.
+    Files younger than min_age_seconds are kept, because a running workflow
+    may have rendered them without storing the post yet.
+    Returns the number of files removed.
+    """
+    if not os.path.isdir(GENERATED_IMAGES_DIR):
+        return 0
+
+    referenced = {os.path.normpath(path) for path in referenced_paths if path}
+    cutoff = time.time() - min_age_seconds
+    removed = 0
+    for directory in (GENERATED_IMAGES_DIR, THUMBNAILS_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or os.path.normpath(entry.path) in referenced:
+                continue
+            if entry.stat().st_mtime > cutoff:
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError as e:
+                print(f"Error removing {entry.path}: {e}")
+    return removed
+
 if __name__ == "__main__":
     # Test
     test_url = "https://images.cointelegraph.com/cdn-cgi/image/format=auto,onerror=redirect,quality=90,width=1024/https://s3.cointelegraph.com/uploads/2025-01/d25ce3e4-7bc5-4e4f-92bc-e05c37b10da3"
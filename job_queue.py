@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import socket
+import threading
+from dotenv import load_dotenv
+import db_manager
+import feed_ingest
+import news_engine
+import pipeline
+import metrics
+
+load_dotenv()
+
+# --- Constants ---
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_POLL_SECONDS = int(os.getenv("JOB_POLL_SECONDS", "10"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A requeued job waits JOB_RETRY_SECONDS, doubling per attempt, so an outage
+# (e.g. Gemini down) does not use up every attempt back to back
+JOB_RETRY_SECONDS = int(os.getenv("JOB_RETRY_SECONDS", "60"))
+STAGE_ORDER = ['selected', 'translated', 'rendered', 'posted']
+
+
+def worker_id():
+    """Identifies this worker in job leases."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class _LeaseKeeper(threading.Thread):
+    """Renews a job lease in the background until stopped; flags a lost lease."""
+
+    def __init__(self, job_id, owner):
+        super().__init__(name=f"lease-{job_id}", daemon=True)
+        self.job_id = job_id
+        self.owner = owner
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(JOB_LEASE_SECONDS / 3):
+            if not db_manager.renew_lease(self.job_id, self.owner, JOB_LEASE_SECONDS):
+                print(f"⚠️ Lost lease on job {self.job_id}")
+                self.lost.set()
+                return
+
+def _select_items(job):
+    """Ingest, dedup and select; the result is checkpointed as the job's item list."""
+    source = (items for feed, items in feed_ingest.iter_feeds())
+    stages = [news_engine.dedup_stage(), news_engine.select_stage(job['top_n'])]
+    selected = [item for batch in pipeline.run_pipeline(source, stages) for item in batch]
+    db_manager.save_selected_job_items(job['id'], selected)
+
+def _process_items(job, lease):
+    """Streams unfinished items through translate -> render -> persist, checkpointing each stage."""
+    records = [record for record in db_manager.get_job_items(job['id']) if record['stage'] != 'posted']
+    if not records:
+        return 0
+
+    def checkpoint(record, stage, **fields):
+        if lease.lost.is_set():
+            raise RuntimeError("job lease lost")
+        record.update(fields, stage=stage)
+        payload = {key: value for key, value in record.items() if key not in ('id', 'stage')}
+        db_manager.update_job_item(record['id'], stage, payload)
+
+    def translate(batch):
+        todo = [record for record in batch if record['stage'] == 'selected']
+        translated = news_engine.translate_items([record['item'] for record in todo]) if todo else []
+        for record, (item, thai_headline, thai_content) in zip(todo, translated):
+            checkpoint(record, 'translated', thai_headline=thai_headline, thai_content=thai_content)
+        return batch
+
+    def render(record):
+        if record['stage'] == 'translated':
+            _, _, _, image_path, thumbnail_path = news_engine.render_item(
+                (record['item'], record['thai_headline'], record['thai_content'])
+            )[0]
+            checkpoint(record, 'rendered', image_path=image_path, thumbnail_path=thumbnail_path)
+        return [record]
+
+    def persist(record):
+        item_id = news_engine.store_item(
+            record['item'], record['thai_headline'], record['thai_content'],
+            record['image_path'], record['thumbnail_path'], bool(job['auto_post'])
+        )
+        checkpoint(record, 'posted', post_id=item_id)
+        return [item_id] if item_id else []
+
+    batch_size = news_engine.TRANSLATION_BATCH_SIZE
+    source = (records[i:i + batch_size] for i in range(0, len(records), batch_size))
+    stages = [
+        pipeline.Stage("translate", translate, workers=news_engine.TRANSLATE_WORKERS),
+        pipeline.Stage("render", render, workers=news_engine.RENDER_WORKERS),
+        pipeline.Stage("persist", persist),
+    ]
+    return len(pipeline.run_pipeline(source, stages))
+
+def run_job(job, owner):
+    """Runs (or resumes) a leased job from its last checkpoints."""
+    lease = _LeaseKeeper(job['id'], owner)
+    lease.start()
+    try:
+        with metrics.run(f"job{job['id']}"):
+            return _run_leased_job(job, owner, lease)
+    finally:
+        lease.stopped.set()
+
+def _run_leased_job(job, owner, lease):
+    try:
+        if not job['selected_at']:
+            _select_items(job)
+        count = _process_items(job, lease)
+        unfinished = [record for record in db_manager.get_job_items(job['id']) if record['stage'] != 'posted']
+        if lease.lost.is_set():
+            return count
+        if not unfinished:
+            db_manager.finish_job(job['id'], owner, 'done')
+            print(f"✅ Job {job['id']}: stored {count} new items")
+        elif job['attempts'] < JOB_MAX_ATTEMPTS:
+            # Requeue; the next attempt resumes from the checkpoints
+            delay = JOB_RETRY_SECONDS * 2 ** (job['attempts'] - 1)
+            db_manager.finish_job(
+                job['id'], owner, 'queued', f"{len(unfinished)} items did not finish", time.time() + delay
+            )
+            print(f"🔁 Job {job['id']}: {len(unfinished)} items left, retrying in {delay}s")
+        else:
+            db_manager.finish_job(job['id'], owner, 'failed', f"{len(unfinished)} items did not finish")
+            print(f"❌ Job {job['id']}: gave up with {len(unfinished)} items unfinished")
+        return count
+    except Exception as e:
+        print(f"❌ Job {job['id']} failed: {e}")
+        db_manager.finish_job(job['id'], owner, 'failed', str(e))
+        return 0
+
+def run_pending_jobs(owner=None):
+    """Claims and runs jobs until the queue is empty. Returns the number of jobs run."""
+    owner = owner or worker_id()
+    jobs_run = 0
+    while True:
+        job = db_manager.claim_job(owner, JOB_LEASE_SECONDS)
+        if not job:
+            return jobs_run
+        print(f"▶️ Running job {job['id']} (attempt {job['attempts']})")
+        run_job(job, owner)
+        jobs_run += 1
+
+def run_now(auto_post=False, top_n=3):
+    """
+    Queues a workflow run and runs it in this process under a lease, unless a
+    scheduler worker claims it first. If a run is already queued, or was left
+    running by a worker that died, that run is resumed here instead.
+    Returns: (job_id, new posts stored here or None if another worker runs it);
+    job_id is None if another worker holds the active run's lease
+    """
+    job_id = db_manager.enqueue_job(auto_post=auto_post, top_n=top_n)
+    owner = worker_id()
+    # Also picks up an expired lease, which would otherwise block every new run
+    job = db_manager.claim_job(owner, JOB_LEASE_SECONDS)
+    if not job:
+        return job_id, None
+    return job['id'], run_job(job, owner)
+
+def work(stop_event=None):
+    """Worker loop: claims queued or abandoned jobs and runs them, until stop_event is set."""
+    owner = worker_id()
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            run_pending_jobs(owner)
+        except Exception as e:
+            print(f"Job worker error: {e}")
+        stop_event.wait(JOB_POLL_SECONDS)
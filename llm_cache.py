@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+# --- Constants ---
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=30)
+    if not _initialized:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)')
+        conn.commit()
+        _initialized = True
+    return conn
+
+def cache_key(model_name, template_version, input_text):
+    """Content address of an LLM call: hash of model, prompt template version and input."""
+    digest = hashlib.sha256()
+    for part in (model_name, template_version, input_text):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def get(key):
+    """Returns the cached value for a key, or None if missing or expired."""
+    now = time.time()
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT value, created_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            metrics.increment("llm_cache_miss")
+            return None
+        if now - row[1] > LLM_CACHE_TTL_SECONDS:
+            conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+            conn.commit()
+            metrics.increment("llm_cache_miss")
+            return None
+        metrics.increment("llm_cache_hit")
+        conn.execute('UPDATE llm_cache SET last_access = ? WHERE key = ?', (now, key))
+        conn.commit()
+        return json.loads(row[0])
+    finally:
+        conn.close()
+
+def put(key, value):
+    """Stores a JSON-serializable value and evicts expired and least recently used entries."""
+    now = time.time()
+    data = json.dumps(value, ensure_ascii=False)
+    conn = _connect()
+    try:
+        conn.execute('''
+        INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (key, data, len(data.encode("utf-8")), now, now))
+        _evict(conn, now)
+        conn.commit()
+    finally:
+        conn.close()
+
+def _evict(conn, now):
+    conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - LLM_CACHE_TTL_SECONDS,))
+    count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache').fetchone()
+    if count <= LLM_CACHE_MAX_ENTRIES and total <= LLM_CACHE_MAX_BYTES:
+        return
+
+    # Walk entries from least recently used until both limits are met
+    to_delete = []
+    for key, size in conn.execute('SELECT key, size FROM llm_cache ORDER BY last_access'):
+        if count <= LLM_CACHE_MAX_ENTRIES and total <= LLM_CACHE_MAX_BYTES:
+            break
+        to_delete.append((key,))
+        count -= 1
+        total -= size
+    conn.executemany('DELETE FROM llm_cache WHERE key = ?', to_delete)
+
+def clear():
+    """Removes every cached response."""
+    conn = _connect()
+    try:
+        conn.execute('DELETE FROM llm_cache')
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,198 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+import db_manager
+
+load_dotenv()
+
+# --- Constants ---
+# Port for the Prometheus text endpoint started by the scheduler; 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_RETENTION_DAYS = int(os.getenv("METRICS_RETENTION_DAYS", "14"))
+# Samples are buffered in memory and written to SQLite in batches of this size
+METRICS_FLUSH_SIZE = 500
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_histograms = {}  # span name -> {"buckets": cumulative counts, "sum": seconds, "count": n}
+_counters = {}  # call name -> count
+_pending = []  # (run_id, name, kind, value, created_at) rows not yet in SQLite
+# Run the current thread's samples belong to; worker threads inherit it via in_current_run
+_run_id = contextvars.ContextVar("metrics_run_id", default=None)
+
+
+def _record(name, kind, value):
+    with _lock:
+        _pending.append((_run_id.get(), name, kind, value, time.time()))
+        should_flush = len(_pending) >= METRICS_FLUSH_SIZE
+    if should_flush:
+        flush()
+
+def observe(name, seconds):
+    """Records one duration for a span in its histogram."""
+    with _lock:
+        histogram = _histograms.setdefault(name, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][index] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+    _record(name, 'timing', seconds)
+
+def increment(name, amount=1):
+    """Counts calls to an external service (Gemini, feeds, image hosts, ...)."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+    _record(name, 'count', amount)
+
+@contextmanager
+def span(name):
+    """Times the enclosed block, including when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+@contextmanager
+def run(name):
+    """
+    Groups the samples recorded inside the block under one run id, and writes
+    them to SQLite when the run ends. The id belongs to the calling thread;
+    threads and pools working for the run must wrap their targets with
+    in_current_run. Concurrent runs in other threads keep their own ids.
+    """
+    run_id = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    token = _run_id.set(run_id)
+    try:
+        with span(f"run_{name}"):
+            yield run_id
+    finally:
+        flush()
+        _run_id.reset(token)
+
+def in_current_run(fn):
+    """Wraps fn so that, called from any thread, its samples count towards the caller's current run."""
+    run_id = _run_id.get()
+
+    def call(*args, **kwargs):
+        token = _run_id.set(run_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _run_id.reset(token)
+
+    return call
+
+def counters():
+    """Returns a copy of this process's call counters."""
+    with _lock:
+        return dict(_counters)
+
+def flush():
+    """Writes buffered samples to SQLite and drops samples past the retention window."""
+    with _lock:
+        samples = _pending[:]
+        _pending.clear()
+    if not samples:
+        return
+    try:
+        db_manager.record_metric_samples(samples, time.time() - METRICS_RETENTION_DAYS * 86400)
+    except Exception as e:
+        print(f"Error writing metrics: {e}")
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..100) of a list of numbers, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+def latency_summary(last_runs=20):
+    """
+    p50/p95 latency per span over the last runs.
+    Returns: list of dicts with 'span', 'calls', 'p50_ms' and 'p95_ms', slowest p95 first
+    """
+    durations = {}
+    for run_id, name, kind, value, finished_at in db_manager.get_metric_samples(last_runs):
+        if kind == 'timing':
+            durations.setdefault(name, []).append(value)
+
+    summary = [
+        {
+            "span": name,
+            "calls": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+        }
+        for name, values in durations.items()
+    ]
+    return sorted(summary, key=lambda row: row["p95_ms"], reverse=True)
+
+def calls_per_run(last_runs=10):
+    """
+    Call counts for each of the last runs, newest first.
+    Returns: list of dicts with 'run' and one key per counted call
+    """
+    runs = {}
+    for run_id, name, kind, value, finished_at in db_manager.get_metric_samples(last_runs):
+        row = runs.setdefault(run_id, {"run": run_id})
+        if kind == 'count':
+            row[name] = row.get(name, 0) + int(value)
+    return list(runs.values())
+
+def render_prometheus():
+    """Renders this process's histograms and counters in the Prometheus text format."""
+    with _lock:
+        histograms = {name: dict(h, buckets=h["buckets"][:]) for name, h in _histograms.items()}
+        counts = dict(_counters)
+
+    lines = [
+        "# HELP news_span_seconds Time spent in instrumented workflow spans.",
+        "# TYPE news_span_seconds histogram",
+    ]
+    for name, histogram in sorted(histograms.items()):
+        for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+            lines.append(f'news_span_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+        lines.append(f'news_span_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'news_span_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+        lines.append(f'news_span_seconds_count{{span="{name}"}} {histogram["count"]}')
+
+    lines += [
+        "# HELP news_calls_total Calls made to external services.",
+        "# TYPE news_calls_total counter",
+    ]
+    for name, count in sorted(counts.items()):
+        lines.append(f'news_calls_total{{call="{name}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=METRICS_PORT):
+    """Serves /metrics on the given port from a background thread. Returns the server."""
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Metrics endpoint: http://localhost:{server.server_address[1]}/metrics")
+    return server
@@ -1,75 +1,69 @@
-import time
 import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 import urllib.parse
 from datetime import datetime
 import db_manager
-import feedparser
-import google.generativeai as genai
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
 import json
 import image_processor
+import feed_ingest
+import dedup
+import gemini_client
+import llm_cache
+import pipeline
+import metrics
+import publisher
+from feed_ingest import clean_html
 
 
 # Load environment variables
 load_dotenv()
 
 # --- Constants ---
-RSS_FEED_URL = "https://cointelegraph.com/rss"
+RSS_FEED_URL = feed_ingest.DEFAULT_FEEDS[0]["url"]
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = 'gemini-2.0-flash'
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "5"))
+# Streaming workflow: worker threads per stage and candidates per AI selection call
+TRANSLATE_WORKERS = int(os.getenv("PIPELINE_TRANSLATE_WORKERS", str(gemini_client.GEMINI_MAX_CONCURRENCY)))
+RENDER_WORKERS = int(os.getenv("PIPELINE_RENDER_WORKERS", str(image_processor.RENDER_WORKERS)))
+SELECT_WINDOW = int(os.getenv("PIPELINE_SELECT_WINDOW", "50"))
+# Bump these whenever the matching prompt changes so cached responses are not reused
+SELECTION_PROMPT_VERSION = "selection-v1"
+# v2: v1 entries may hold English text cached when a response lacked headline/content
+TRANSLATION_PROMPT_VERSION = "translation-v2"
 
-# Configure Gemini
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+# Gemini is configured by gemini_client
+if not GEMINI_API_KEY:
     print("WARNING: GEMINI_API_KEY not found in environment variables.")
 
 
-def clean_html(html_content):
-    """Removes HTML tags from the string."""
-    soup = BeautifulSoup(html_content, "html.parser")
-    return soup.get_text(separator=" ", strip=True)
+def fetch_rss_news(feeds=None):
+    """
+    Fetches news from every feed in the registry concurrently.
+    Returns: merged list of news items, newest first.
+    """
+    feeds = feed_ingest.load_feed_registry() if feeds is None else feeds
+    print(f"Fetching news from {len(feeds)} feeds...")
+
+    news_items = feed_ingest.fetch_all_feeds(feeds)
 
-def fetch_rss_news():
-    """Fetches news from Cointelegraph RSS feed."""
-    print(f"Fetching news from {RSS_FEED_URL}...")
-    
-    feed = feedparser.parse(RSS_FEED_URL)
-    
-    if feed.bozo:
-        print("Error parsing RSS feed")
-        return []
-    
-    news_items = []
-    # Fetch top 10 items for AI selection
-    for entry in feed.entries[:10]:
-        
-        # Try to find an existing image or use placeholder
-        image_url = "https://via.placeholder.com/1024x1024?text=News+Image"
-        
-        if 'media_content' in entry:
-            image_url = entry.media_content[0]['url']
-        elif 'links' in entry:
-            for link in entry.links:
-                if link.get('type') in ['image/jpeg', 'image/png']:
-                    image_url = link['href']
-                    break
-        
-        # Clean the summary
-        clean_summary = clean_html(entry.summary)
-
-        news_items.append({
-            "title": entry.title,
-            "url": entry.link,
-            "summary": clean_summary,
-            "published": entry.published,
-            "image_url": image_url
-        })
-        
     print(f"Fetched {len(news_items)} items.")
     return news_items
 
+def parse_json_response(text):
+    """Parses a JSON model response, tolerating Markdown code fences around it."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return json.loads(text)
+
+def _is_valid_selection(indices):
+    """Checks a selection response: a JSON array of item numbers."""
+    return isinstance(indices, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in indices)
+
 def select_interesting_news(news_items, top_n=3):
     """
     Uses Gemini AI to select the most interesting news items.
@@ -82,8 +76,6 @@ def select_interesting_news(news_items, top_n=3):
     print(f"Using Gemini AI to select top {top_n} interesting news...")
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
         # Create a prompt with all news items
         news_list = ""
         for i, item in enumerate(news_items, 1):
@@ -102,10 +94,17 @@ def select_interesting_news(news_items, top_n=3):
         Example: [3, 7, 1]
         """
         
-        response = model.generate_content(prompt)
+        cache_key = llm_cache.cache_key(GEMINI_MODEL, SELECTION_PROMPT_VERSION, f"{top_n}\n{news_list}")
+        selected_indices = llm_cache.get(cache_key)
         
-        # Parse response
-        selected_indices = json.loads(response.text.strip())
+        if not _is_valid_selection(selected_indices):
+            response = gemini_client.generate_content(GEMINI_MODEL, prompt)
+            
+            # Parse response; only a well-formed answer is cached
+            selected_indices = parse_json_response(response.text)
+            if not _is_valid_selection(selected_indices):
+                raise ValueError(f"unexpected selection response: {response.text[:200]}")
+            llm_cache.put(cache_key, selected_indices)
         
         # Convert to 0-indexed and get selected items
         selected_news = [news_items[idx - 1] for idx in selected_indices if 1 <= idx <= len(news_items)]
@@ -118,17 +117,30 @@ def select_interesting_news(news_items, top_n=3):
         # Fallback
         return news_items[:top_n]
 
+def _translation_cache_key(original_title, original_summary):
+    return llm_cache.cache_key(GEMINI_MODEL, TRANSLATION_PROMPT_VERSION, f"{original_title}\n{original_summary}")
+
+def _get_cached_translation(original_title, original_summary):
+    cached = llm_cache.get(_translation_cache_key(original_title, original_summary))
+    return tuple(cached) if cached else None
+
+def _cache_translation(original_title, original_summary, thai_headline, thai_content):
+    llm_cache.put(_translation_cache_key(original_title, original_summary), [thai_headline, thai_content])
+
 def generate_thai_content(original_title, original_summary):
     """
     Uses Gemini to generate Thai headline and content.
-    Returns: (thai_headline, thai_content)
+    Returns: (thai_headline, thai_content), or None if there is no API key or
+    the request failed
     """
     if not GEMINI_API_KEY:
-        return f"[NO KEY] {original_title}", f"[NO KEY] {original_summary}"
+        return None
+    
+    cached = _get_cached_translation(original_title, original_summary)
+    if cached:
+        return cached
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
         prompt = f"""
         คุณเป็นนักเขียนข่าว crypto/blockchain สำหรับชาวไทย
         
@@ -151,81 +163,283 @@ def generate_thai_content(original_title, original_summary):
         }}
         """
         
-        response = model.generate_content(prompt)
-        result = json.loads(response.text.strip())
+        response = gemini_client.generate_content(GEMINI_MODEL, prompt)
+        result = parse_json_response(response.text)
+        if not _is_valid_translation(result):
+            # Never fall back to the English text: it would be stored (and cached) as a translation
+            print(f"Thai content generation error: unexpected response: {response.text[:200]}")
+            return None
         
-        return result.get("headline", original_title), result.get("content", original_summary)
+        thai_headline, thai_content = result["headline"].strip(), result["content"].strip()
+        _cache_translation(original_title, original_summary, thai_headline, thai_content)
+        return thai_headline, thai_content
         
     except Exception as e:
         print(f"Thai content generation error: {e}")
-        return f"[ERROR] {original_title}", f"[ERROR] {original_summary}"
+        return None
 
-def process_news_item(news_item):
+def _is_valid_translation(result):
+    """Checks one translated item: a dict with non-empty 'headline' and 'content' strings."""
+    return (
+        isinstance(result, dict)
+        and isinstance(result.get("headline"), str) and result["headline"].strip()
+        and isinstance(result.get("content"), str) and result["content"].strip()
+    )
+
+def _translate_batch(news_items):
     """
-    Processes a single news item: generates Thai content and branded image.
-    Returns: (thai_headline, thai_content, image_path)
+    Translates several items with one Gemini request.
+    Returns: dict of {position in news_items: (thai_headline, thai_content)} for valid results only
     """
-    print(f"Processing: {news_item['title']}")
+    news_list = ""
+    for i, item in enumerate(news_items, 1):
+        news_list += f"ข่าวที่ {i} (id: {i})\nหัวข้อ: {item['title']}\nสรุป: {item['summary']}\n\n"
+
+    prompt = f"""
+    คุณเป็นนักเขียนข่าว crypto/blockchain สำหรับชาวไทย
+    
+    ข่าวต้นฉบับ (ภาษาอังกฤษ) จำนวน {len(news_items)} ข่าว:
+    {news_list}
     
-    # Generate Thai content
-    thai_headline, thai_content = generate_thai_content(news_item['title'], news_item['summary'])
+    สำหรับข่าวแต่ละข่าว กรุณาสร้าง:
+    1. HEADLINE: หัวข้อภาษาไทยสั้นๆ กระชับ น่าสนใจ (ไม่เกิน 50 ตัวอักษร)
+    2. CONTENT: เนื้อหาภาษาไทยที่ละเอียด อ่านง่าย เข้าใจง่าย น่าสนใจ สำหรับโพสต์ Facebook 
+       - ยาว 200-300 คำ
+       - อธิบายรายละเอียดให้ครบถ้วน
+       - มีข้อมูลที่น่าสนใจ
+       - เหมาะสำหรับคนที่สนใจ crypto
     
-    # Create branded image with Thai headline
-    image_path = None
+    ตอบกลับเป็น JSON array เท่านั้น โดยมีหนึ่ง object ต่อข่าว และใช้ id ตามที่กำหนด:
+    [
+      {{"id": 1, "headline": "หัวข้อภาษาไทย", "content": "เนื้อหาภาษาไทยแบบยาว ละเอียด"}}
+    ]
+    """
+
+    response = gemini_client.generate_content(GEMINI_MODEL, prompt)
+    results = parse_json_response(response.text)
+
+    translations = {}
+    for result in results if isinstance(results, list) else []:
+        if not _is_valid_translation(result):
+            continue
+        try:
+            position = int(result.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= position < len(news_items):
+            item = news_items[position]
+            translations[position] = (result["headline"].strip(), result["content"].strip())
+            _cache_translation(item['title'], item['summary'], *translations[position])
+    return translations
+
+def generate_thai_content_batch(news_items, batch_size=TRANSLATION_BATCH_SIZE):
+    """
+    Generates Thai headline and content for many items, several per Gemini request.
+    Previously translated items are served from llm_cache. Items missing or
+    invalid in a batch response are retried in smaller batches; single items
+    fall back to generate_thai_content.
+    Returns: list of (thai_headline, thai_content), or None for items that
+    could not be translated, aligned with news_items
+    """
+    if not GEMINI_API_KEY:
+        return [None] * len(news_items)
+
+    results = [None] * len(news_items)
+    uncached = []
+    for index, item in enumerate(news_items):
+        results[index] = _get_cached_translation(item['title'], item['summary'])
+        if results[index] is None:
+            uncached.append(index)
+    if len(uncached) < len(news_items):
+        print(f"Reusing {len(news_items) - len(uncached)} cached translations")
+
+    batches = [uncached[i:i + batch_size] for i in range(0, len(uncached), batch_size)]
+
+    while batches:
+        retry = []
+        workers = min(len(batches), gemini_client.get_client().max_concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for batch in batches:
+                if len(batch) == 1:
+                    item = news_items[batch[0]]
+                    future = executor.submit(metrics.in_current_run(generate_thai_content), item['title'], item['summary'])
+                else:
+                    future = executor.submit(metrics.in_current_run(_translate_batch), [news_items[i] for i in batch])
+                futures[future] = batch
+
+            for future in as_completed(futures):
+                batch = futures[future]
+                if len(batch) == 1:
+                    results[batch[0]] = future.result()
+                    continue
+                try:
+                    translations = future.result()
+                except Exception as e:
+                    print(f"Batch translation error: {e}")
+                    translations = {}
+
+                failed = [index for position, index in enumerate(batch) if position not in translations]
+                for position, index in enumerate(batch):
+                    if position in translations:
+                        results[index] = translations[position]
+                if failed:
+                    print(f"Retrying {len(failed)} of {len(batch)} items from a failed batch")
+                    half = max(1, (len(failed) + 1) // 2)
+                    retry.extend(failed[i:i + half] for i in range(0, len(failed), half))
+        batches = retry
+
+    return results
+
+def dedup_stage():
+    """Ingest -> dedup: takes one feed's items, emits the ones not yet seen."""
+    seen_urls = set()
+    near_duplicates = dedup.NearDuplicateFilter()
+
+    def handle(feed_items):
+        known_urls = db_manager.get_known_urls(item['url'] for item in feed_items)
+        for item in feed_items:
+            if item['url'] in known_urls or item['url'] in seen_urls:
+                continue
+            seen_urls.add(item['url'])
+            if near_duplicates.accept(item):
+                yield item
+
+    return pipeline.Stage("dedup", handle)
+
+def select_stage(top_n):
+    """
+    Dedup -> select: Gemini shortlists top_n of every SELECT_WINDOW candidates
+    while feeds are still arriving; once they are all in, a final pass picks
+    top_n from the shortlist, so each run selects at most top_n stories.
+    """
+    window = []
+    shortlist = []
+
+    def shortlist_window():
+        shortlist.extend(select_interesting_news(window[:], top_n=top_n))
+        window.clear()
+
+    def handle(item):
+        window.append(item)
+        if len(window) >= SELECT_WINDOW:
+            shortlist_window()
+
+    def flush():
+        if window:
+            shortlist_window()
+        selected = select_interesting_news(shortlist, top_n=top_n) if len(shortlist) > top_n else shortlist
+        # Hand over in translation-sized batches
+        return [selected[i:i + TRANSLATION_BATCH_SIZE] for i in range(0, len(selected), TRANSLATION_BATCH_SIZE)]
+
+    return pipeline.Stage("select", handle, flush=flush)
+
+def translate_items(batch):
+    """
+    Select -> translate: one batch of items in, (item, headline, content) out.
+    Headline and content are None for items that could not be translated.
+    """
+    return [
+        (item, *(translation or (None, None)))
+        for item, translation in zip(batch, generate_thai_content_batch(batch))
+    ]
+
+def render_item(translated):
+    """Translate -> render: adds the branded image (or the source image on failure)."""
+    item, thai_headline, thai_content = translated
+    thumbnail_path = None
     try:
-        image_path = image_processor.add_headline_to_image(
-            news_item['image_url'],
-            thai_headline,
-            output_path=None  # Auto-generate path
-        )
-        print(f"Generated branded image: {image_path}")
+        image_path = image_processor.render_image(item['image_url'], thai_headline or item['title'])
     except Exception as e:
         print(f"Image processing error: {e}")
-        # Fallback to original image
-        image_path = news_item['image_url']
+        image_path = None
     
-    return thai_headline, thai_content, image_path
+    if image_path:
+        print(f"Generated branded image: {image_path}")
+        thumbnail_path = image_processor.thumbnail_path_for(image_path)
+    else:
+        # Fallback to original image; the dashboard backfills its thumbnail
+        image_path = item['image_url']
+    return [(item, thai_headline, thai_content, image_path, thumbnail_path)]
 
-def trigger_news_workflow(auto_post=False):
-    """Orchestrates the enhanced news workflow."""
-    # 1. Fetch news
-    raw_news = fetch_rss_news()
-    
-    if not raw_news:
-        print("No news fetched")
-        return 0
+def post_to_facebook(item_id, message, image_path):
+    """
+    Queues a post for the Facebook Page and returns immediately; publisher.py
+    sends it in the background and marks it 'posted' once Facebook accepts it.
+    Returns: True if the post is queued, False if it was already published
+    """
+    queued = db_manager.enqueue_post(item_id, message, image_path)
+    if queued:
+        publisher.kick()
+    return queued
+
+def store_item(item, thai_headline, thai_content, image_path, thumbnail_path, auto_post=False):
+    """
+    Stores a finished post and indexes it for dedup; with auto_post it is
+    also queued for publishing. Items that could not be translated (no
+    headline/content) are stored with their original text and left pending
+    for review, never auto-posted.
+    Returns the new id, or None if already stored.
+    """
+    translated = bool(thai_headline and thai_content)
+    with metrics.span("db_store"):
+        # The post and its outbox entry are written together
+        item_id = db_manager.add_news_item(
+            title=thai_headline if translated else item['title'],  # Use Thai headline as title
+            summary=thai_content if translated else item['summary'],  # Thai content as summary
+            image_path=image_path,  # Branded image path
+            url=item['url'],
+            thumbnail_path=thumbnail_path,
+            publish=auto_post and translated
+        )
+        if item_id:
+            dedup.record_story(item, item_id)
+    if item_id and auto_post:
+        if translated:
+            publisher.kick()
+        else:
+            print(f"⚠️ Not auto-posting untranslated item {item_id}, left pending: {item['title']}")
+    return item_id
+
+def persist_stage(auto_post):
+    """Render -> persist: stores the post and emits its id."""
+
+    def handle(rendered):
+        item_id = store_item(*rendered, auto_post)
+        if item_id:
+            return [item_id]
+
+    return pipeline.Stage("persist", handle)
+
+def trigger_news_workflow(auto_post=False, top_n=3):
+    """
+    Orchestrates the enhanced news workflow as a streaming pipeline:
+    ingest -> dedup -> select -> translate -> render -> persist.
+    Stages overlap (item N+1 is translated while item N renders and is
+    stored) and are connected by bounded queues.
+    Returns: number of new posts stored
+    """
+    # 1. Fetch news, one feed at a time as downloads complete
+    source = (items for feed, items in feed_ingest.iter_feeds())
     
-    # 2. AI selects interesting news
-    selected_news = select_interesting_news(raw_news, top_n=3)
+    stages = [
+        # 2. Skip stories already stored (or near-duplicates) before paying for AI calls
+        dedup_stage(),
+        # 3. AI selects interesting news
+        select_stage(top_n),
+        # 4. Translate, render and store each selected item
+        pipeline.Stage("translate", translate_items, workers=TRANSLATE_WORKERS),
+        pipeline.Stage("render", render_item, workers=RENDER_WORKERS),
+        persist_stage(auto_post),
+    ]
     
-    # 3. Process each selected item
-    count = 0
-    for item in selected_news:
-        try:
-            thai_headline, thai_content, image_path = process_news_item(item)
-            
-            # Rate limiting for Gemini Free Tier
-            if GEMINI_API_KEY:
-                time.sleep(20)  # Conservative delay for free tier
-            
-            status = 'posted' if auto_post else 'pending'
-            
-            db_manager.add_news_item(
-                title=thai_headline,  # Use Thai headline as title
-                summary=thai_content,  # Thai content as summary
-                image_path=image_path,  # Branded image path
-                url=item['url'],
-                status=status
-            )
-            count += 1
-            
-        except Exception as e:
-            print(f"Error processing news item: {e}")
-            continue
-        
+    with metrics.run("workflow"):
+        count = len(pipeline.run_pipeline(source, stages))
+    print(f"Workflow stored {count} new items")
     return count
 
 if __name__ == "__main__":
+    db_manager.init_db()
     count = trigger_news_workflow(auto_post=False)
     print(f"Processed {count} news items.")
 
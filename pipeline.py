@@ -0,0 +1,109 @@
+import os
+import queue
+import threading
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+# --- Constants ---
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+
+_END = object()  # end-of-stream marker passed between stages
+
+
+class Stage:
+    """
+    One step of a streaming pipeline.
+    `handler(item)` returns an iterable of outputs for the next stage (or None).
+    `flush()`, if given, is called once after the last input and may return
+    final outputs; use it for stages that buffer (only with workers=1).
+    """
+
+    def __init__(self, name, handler, workers=1, flush=None):
+        if flush is not None and workers != 1:
+            raise ValueError(f"Stage '{name}' buffers items and must run with a single worker")
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.flush = flush
+
+
+def _emit(outputs, out_queue):
+    for output in outputs or ():
+        out_queue.put(output)
+
+def _run_stage(stage, in_queue, out_queue, downstream_workers, state):
+    while True:
+        item = in_queue.get()
+        if item is _END:
+            break
+        try:
+            # Time the handler only, not the wait for room in the next queue. Outputs
+            # are collected inside the span so generator handlers are timed too.
+            with metrics.span(f"stage_{stage.name}"):
+                outputs = list(stage.handler(item) or ())
+            _emit(outputs, out_queue)
+        except Exception as e:
+            print(f"Pipeline stage '{stage.name}' error: {e}")
+
+    with state["lock"]:
+        state["finished"] += 1
+        last = state["finished"] == stage.workers
+    if last:
+        # The last worker to finish flushes buffered items and closes the next queue
+        if stage.flush:
+            try:
+                with metrics.span(f"stage_{stage.name}"):
+                    outputs = list(stage.flush() or ())
+                _emit(outputs, out_queue)
+            except Exception as e:
+                print(f"Pipeline stage '{stage.name}' error: {e}")
+        for _ in range(downstream_workers):
+            out_queue.put(_END)
+
+def _run_source(source, out_queue, downstream_workers):
+    try:
+        for item in source:
+            out_queue.put(item)
+    except Exception as e:
+        print(f"Pipeline source error: {e}")
+    finally:
+        for _ in range(downstream_workers):
+            out_queue.put(_END)
+
+def run_pipeline(source, stages, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Streams items from `source` through `stages`. Stages run concurrently,
+    each with its own worker threads, connected by bounded queues, so memory
+    use stays bounded and a slow stage holds back the ones before it.
+    Returns: list of the outputs of the last stage
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(
+        target=metrics.in_current_run(_run_source), args=(source, queues[0], stages[0].workers),
+        name="pipeline-source", daemon=True
+    )]
+
+    for index, stage in enumerate(stages):
+        downstream_workers = stages[index + 1].workers if index + 1 < len(stages) else 1
+        state = {"lock": threading.Lock(), "finished": 0}
+        for worker in range(stage.workers):
+            threads.append(threading.Thread(
+                target=metrics.in_current_run(_run_stage), args=(stage, queues[index], queues[index + 1], downstream_workers, state),
+                name=f"pipeline-{stage.name}-{worker}", daemon=True
+            ))
+
+    for thread in threads:
+        thread.start()
+
+    results = []
+    while True:
+        item = queues[-1].get()
+        if item is _END:
+            break
+        results.append(item)
+
+    for thread in threads:
+        thread.join()
+    return results
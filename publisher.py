@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import mimetypes
+import urllib.parse
+import requests
+from dotenv import load_dotenv
+import db_manager
+import metrics
+
+load_dotenv()
+
+# --- Constants ---
+# Point FB_GRAPH_URL at a local mock endpoint to test publishing offline
+FB_GRAPH_URL = os.getenv("FB_GRAPH_URL", "https://graph.facebook.com/v19.0").rstrip("/")
+FB_PAGE_ID = os.getenv("FB_PAGE_ID")
+FB_PAGE_ACCESS_TOKEN = os.getenv("FB_PAGE_ACCESS_TOKEN")
+# The Graph API accepts at most 50 operations per batch request
+PUBLISH_BATCH_SIZE = min(50, int(os.getenv("PUBLISH_BATCH_SIZE", "50")))
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", "4"))
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "6"))
+PUBLISH_POLL_SECONDS = int(os.getenv("PUBLISH_POLL_SECONDS", "5"))
+PUBLISH_LEASE_SECONDS = 300
+PUBLISH_TIMEOUT = 120
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 900
+# Graph API error codes for throttling and temporary failures
+RETRYABLE_ERROR_CODES = {1, 2, 4, 17, 32, 341, 368, 613}
+
+_thread_local = threading.local()
+_kick_lock = threading.Lock()
+_kick_requested = threading.Event()
+_kick_thread = None
+_warned_unconfigured = False
+
+
+def is_configured():
+    """True when a Page id and access token are set."""
+    return bool(FB_PAGE_ID and FB_PAGE_ACCESS_TOKEN)
+
+def _get_session():
+    """Returns a requests session local to the current worker thread."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+def _operation(entry, index, files):
+    """
+    Builds one Graph batch operation for an outbox entry. Local images are
+    uploaded as attached files, remote ones by URL; posts without an image
+    go to the Page feed.
+    """
+    image_path = entry['image_path']
+    if image_path and os.path.isfile(image_path):
+        name = f"file{index}"
+        with open(image_path, "rb") as f:
+            files[name] = (os.path.basename(image_path), f.read(), mimetypes.guess_type(image_path)[0] or "image/jpeg")
+        body = {"message": entry['message']}
+        return {"method": "POST", "relative_url": f"{FB_PAGE_ID}/photos", "attached_files": name,
+                "body": urllib.parse.urlencode(body)}
+    if image_path and image_path.startswith(("http://", "https://")):
+        body = {"message": entry['message'], "url": image_path}
+        return {"method": "POST", "relative_url": f"{FB_PAGE_ID}/photos", "body": urllib.parse.urlencode(body)}
+    return {"method": "POST", "relative_url": f"{FB_PAGE_ID}/feed",
+            "body": urllib.parse.urlencode({"message": entry['message']})}
+
+def _error(body, status_code):
+    """Returns (message, retryable) for a failed Graph API response body."""
+    try:
+        error = json.loads(body).get("error", {}) if isinstance(body, str) else (body or {}).get("error", {})
+    except ValueError:
+        error = {}
+    retryable = status_code >= 500 or status_code == 429 or error.get("code") in RETRYABLE_ERROR_CODES
+    return f"{status_code}: {error.get('message') or body}", retryable
+
+def send_batch(entries):
+    """
+    Publishes outbox entries with one Graph API batch request.
+    Returns: (sent, failed) with sent as [(outbox_id, fb_post_id)] and
+    failed as [(outbox_id, error, retryable)]
+    """
+    files = {}
+    operations = [_operation(entry, index, files) for index, entry in enumerate(entries)]
+    data = {"access_token": FB_PAGE_ACCESS_TOKEN, "batch": json.dumps(operations), "include_headers": "false"}
+
+    with metrics.span("facebook_batch"):
+        metrics.increment("facebook_batch_request")
+        response = _get_session().post(f"{FB_GRAPH_URL}/", data=data, files=files or None, timeout=PUBLISH_TIMEOUT)
+
+    if response.status_code != 200:
+        message, retryable = _error(response.text, response.status_code)
+        return [], [(entry['id'], message, retryable) for entry in entries]
+
+    sent, failed = [], []
+    for entry, result in zip(entries, response.json()):
+        if result is None:
+            # Facebook did not run this operation (batch timeout); try it again
+            failed.append((entry['id'], "operation not executed", True))
+        elif result.get("code") == 200:
+            body = json.loads(result.get("body") or "{}")
+            sent.append((entry['id'], body.get("post_id") or body.get("id")))
+        else:
+            failed.append((entry['id'], *_error(result.get("body"), result.get("code", 0))))
+    return sent, failed
+
+def _retry_at(attempts):
+    """Exponential backoff with jitter for an entry that has been tried `attempts` times."""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return time.time() + delay + random.uniform(0, delay / 2)
+
+async def _dispatch(entries):
+    """Sends claimed entries in batches, PUBLISH_CONCURRENCY requests at a time, and records the outcome."""
+    semaphore = asyncio.Semaphore(PUBLISH_CONCURRENCY)
+
+    async def send(batch):
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(send_batch, batch)
+            except Exception as e:
+                return [], [(entry['id'], str(e), True) for entry in batch]
+
+    batches = [entries[i:i + PUBLISH_BATCH_SIZE] for i in range(0, len(entries), PUBLISH_BATCH_SIZE)]
+    attempts = {entry['id']: entry['attempts'] for entry in entries}
+    sent, failures = [], []
+    for batch_sent, batch_failed in await asyncio.gather(*(send(batch) for batch in batches)):
+        sent.extend(batch_sent)
+        for outbox_id, error, retryable in batch_failed:
+            give_up = not retryable or attempts[outbox_id] >= PUBLISH_MAX_ATTEMPTS
+            failures.append((outbox_id, error, None if give_up else _retry_at(attempts[outbox_id])))
+
+    if sent:
+        db_manager.mark_outbox_sent(sent)
+        metrics.increment("facebook_post", len(sent))
+    if failures:
+        db_manager.mark_outbox_failed(failures)
+        for outbox_id, error, retry_at in failures:
+            print(f"❌ Facebook publish failed ({'retrying' if retry_at else 'giving up'}): {error}")
+    return len(sent)
+
+async def drain():
+    """Publishes every due outbox entry. Returns the number of posts published."""
+    global _warned_unconfigured
+    if not is_configured():
+        if not _warned_unconfigured:
+            print("WARNING: FB_PAGE_ID / FB_PAGE_ACCESS_TOKEN not set, posts stay queued.")
+            _warned_unconfigured = True
+        return 0
+
+    published = 0
+    while True:
+        entries = db_manager.claim_outbox(PUBLISH_BATCH_SIZE * PUBLISH_CONCURRENCY, PUBLISH_LEASE_SECONDS)
+        if not entries:
+            return published
+        published += await _dispatch(entries)
+
+async def _run_forever(stop_event):
+    while not stop_event.is_set():
+        try:
+            published = await drain()
+            if published:
+                print(f"📤 Published {published} posts to Facebook")
+        except Exception as e:
+            print(f"Publisher error: {e}")
+        await asyncio.to_thread(stop_event.wait, PUBLISH_POLL_SECONDS)
+
+def run_dispatcher(stop_event=None):
+    """Dispatcher loop for a background thread: drains the outbox every PUBLISH_POLL_SECONDS."""
+    asyncio.run(_run_forever(stop_event or threading.Event()))
+
+def _drain_while_kicked():
+    global _kick_thread
+    while True:
+        with _kick_lock:
+            if not _kick_requested.is_set():
+                _kick_thread = None
+                return
+            _kick_requested.clear()
+        try:
+            asyncio.run(drain())
+        except Exception as e:
+            print(f"Publisher error: {e}")
+
+def kick():
+    """
+    Drains the outbox in a background thread so callers return immediately.
+    Kicks during a drain make it run once more, so no queued post is missed.
+    """
+    global _kick_thread
+    with _kick_lock:
+        _kick_requested.set()
+        if _kick_thread is None:
+            _kick_thread = threading.Thread(target=_drain_while_kicked, name="publisher-kick", daemon=True)
+            _kick_thread.start()
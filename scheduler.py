@@ -2,14 +2,18 @@ import schedule
 import time
 import os
 import sys
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-import news_engine
 import db_manager
+import image_processor
+import job_queue
+import metrics
+import publisher
 
 load_dotenv()
 
@@ -24,25 +28,59 @@ def post_news():
     print(f"{'='*60}\n")
     
     try:
-        # Run the news workflow with auto_post=True
-        count = news_engine.trigger_news_workflow(auto_post=True)
-        
-        print(f"\n✅ Successfully processed and posted {count} news items")
+        # Queue a durable workflow run with auto_post=True; the job worker picks it up
+        job_id = db_manager.enqueue_job(auto_post=True)
+        if job_id:
+            print(f"\n✅ Queued workflow job {job_id}")
+        else:
+            print("\n⏭️ A workflow job is already queued or running, skipping")
         print(f"{'='*60}\n")
         
     except Exception as e:
         print(f"\n❌ Error during auto-post: {e}")
         print(f"{'='*60}\n")
 
+def cleanup_images():
+    """
+    Scheduled job that deletes generated images no post refers to any more.
+    """
+    try:
+        removed = image_processor.collect_garbage(db_manager.get_referenced_image_paths())
+        print(f"🧹 Removed {removed} unreferenced images")
+    except Exception as e:
+        print(f"\n❌ Error during image cleanup: {e}")
+
+def archive_posts():
+    """
+    Scheduled job that moves old posts and their images to the compressed
+    archive, keeping the live database small.
+    """
+    try:
+        archived = db_manager.archive_old_posts()
+        print(f"🗄️ Archived {archived} posts older than {db_manager.ARCHIVE_AFTER_DAYS} days")
+    except Exception as e:
+        print(f"\n❌ Error during archival: {e}")
+
 def run_scheduler():
     """
     Sets up and runs the scheduler for automatic posting.
     Posts 3 times daily: 9am, 3pm (15:00), 9pm (21:00)
     """
+    db_manager.init_db()
+
+    # The job worker also resumes any run interrupted by a crash or restart
+    threading.Thread(target=job_queue.work, name="job-worker", daemon=True).start()
+    # Publishes approved and auto-posted items, retrying failures with backoff
+    threading.Thread(target=publisher.run_dispatcher, name="publisher", daemon=True).start()
+    if metrics.METRICS_PORT:
+        metrics.serve(metrics.METRICS_PORT)
+
     # Schedule jobs
     schedule.every().day.at("09:00").do(post_news)
     schedule.every().day.at("15:00").do(post_news)
     schedule.every().day.at("21:00").do(post_news)
+    schedule.every().day.at("03:30").do(cleanup_images)
+    schedule.every().day.at("04:00").do(archive_posts)
     
     print("\n" + "="*60)
     print("📅 SCHEDULER STARTED")
@@ -51,6 +89,8 @@ def run_scheduler():
     print("   - 09:00 (9am)")
     print("   - 15:00 (3pm)")
     print("   - 21:00 (9pm)")
+    print("🧹 Image cleanup: 03:30")
+    print(f"🗄️ Archival (posts older than {db_manager.ARCHIVE_AFTER_DAYS} days): 04:00")
     print("="*60 + "\n")
     print("Press Ctrl+C to stop the scheduler\n")
     
@@ -0,0 +1,174 @@
+import os
+import unicodedata
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Word segmenters for Thai, which is written without spaces between words:
+# PyThaiNLP's dictionary segmenter (in requirements.txt), or ICU line
+# breaking. Breaking between Thai character clusters is a last resort for
+# installs without either, and can split words.
+try:
+    from pythainlp.tokenize import word_tokenize as _thai_word_tokenize
+except ImportError:
+    _thai_word_tokenize = None
+
+try:
+    import icu
+except ImportError:
+    icu = None
+
+# --- Constants ---
+# Bump when the line breaking or fitting rules change; part of the render digest
+LAYOUT_VERSION = 1
+ELLIPSIS = "…"
+# Thai vowels written before the consonant they follow in speech: never break after them
+_LEADING_VOWELS = set("เแโใไ")
+# Vowels and the repetition mark that must stay with the preceding syllable
+_FOLLOWING_MARKS = set("ะาำๅๆฯ")
+
+
+def _available_segmenter(name):
+    return {"pythainlp": _thai_word_tokenize is not None, "icu": icu is not None, "cluster": True}.get(name, False)
+
+def _choose_segmenter():
+    requested = os.getenv("TEXT_SEGMENTER")
+    if requested and _available_segmenter(requested):
+        return requested
+    if requested:
+        print(f"Text segmenter '{requested}' is not available, choosing automatically")
+    for name in ("pythainlp", "icu"):
+        if _available_segmenter(name):
+            return name
+    print("WARNING: pythainlp is not installed, Thai headlines may break inside words (pip install pythainlp)")
+    return "cluster"
+
+SEGMENTER = _choose_segmenter()
+
+
+def clusters(text):
+    """
+    Splits text into units that must not be broken apart: a character with
+    its combining marks, leading vowels with the next consonant, and
+    following vowels with the previous syllable.
+    """
+    units = []
+    for char in text:
+        attaches = (
+            unicodedata.category(char) in ("Mn", "Mc", "Me")
+            or char in _FOLLOWING_MARKS
+            or (units and units[-1][-1] in _LEADING_VOWELS)
+        )
+        if units and attaches and not units[-1].isspace() and not char.isspace():
+            units[-1] += char
+        else:
+            units.append(char)
+    return units
+
+def _icu_segments(text):
+    breaker = icu.BreakIterator.createLineInstance(icu.Locale("th"))
+    breaker.setText(text)
+    start = breaker.first()
+    segments = []
+    for end in breaker:
+        segments.append(text[start:end])
+        start = end
+    return segments
+
+def _is_thai(char):
+    return "\u0e00" <= char <= "\u0e7f"
+
+def _cluster_segments(text):
+    """Whole words for spaced scripts; single clusters inside runs of Thai."""
+    segments = []
+    for unit in clusters(text):
+        joins_word = (
+            segments and not unit.isspace() and not _is_thai(unit[0])
+            and not segments[-1][-1].isspace() and not _is_thai(segments[-1][-1])
+        )
+        if joins_word:
+            segments[-1] += unit
+        else:
+            segments.append(unit)
+    return segments
+
+@lru_cache(maxsize=1024)
+def segment(text):
+    """
+    Splits text into line break candidates whose concatenation is the text.
+    Returns: tuple of segments
+    """
+    if SEGMENTER == "pythainlp":
+        segments = _thai_word_tokenize(text, engine="newmm", keep_whitespace=True)
+    elif SEGMENTER == "icu":
+        segments = _icu_segments(text)
+    else:
+        segments = _cluster_segments(text)
+    return tuple(segment for segment in segments if segment)
+
+@lru_cache(maxsize=65536)
+def measure(font, text):
+    """Advance width of text in a font, cached per (font, text)."""
+    return font.getlength(text)
+
+def wrap(text, font, max_width):
+    """
+    Greedy single pass line fitting: every segment is measured once (and
+    cached), so long headlines cost linear time. Segments wider than a line
+    are broken between clusters.
+    Returns: list of lines
+    """
+    lines = []
+    current = []
+    width = 0.0
+    pending = list(reversed(segment(text)))
+    while pending:
+        piece = pending.pop()
+        piece_width = measure(font, piece)
+        if piece.isspace():
+            if current:
+                current.append(piece)
+                width += piece_width
+            continue
+        if current and width + piece_width > max_width:
+            lines.append("".join(current).rstrip())
+            current, width = [], 0.0
+        if not current and piece_width > max_width and len(clusters(piece)) > 1:
+            pending.extend(reversed(clusters(piece)))
+            continue
+        current.append(piece)
+        width += piece_width
+    if current:
+        lines.append("".join(current).rstrip())
+    return lines
+
+def _truncate(line, font, max_width):
+    """Shortens a line (by clusters) until it fits with a trailing ellipsis."""
+    units = clusters(line)
+    widths = [measure(font, unit) for unit in units]
+    width = sum(widths) + measure(font, ELLIPSIS)
+    while units and width > max_width:
+        units.pop()
+        width -= widths.pop()
+    return "".join(units).rstrip() + ELLIPSIS
+
+def fit_text(text, load_font, max_width, max_lines, font_size, min_font_size, step=2):
+    """
+    Wraps text to max_width, shrinking the font from font_size towards
+    min_font_size until it fits in max_lines. If it still does not fit at the
+    minimum size, the last line is cut with an ellipsis.
+    `load_font(size)` returns the font for a size (it should be cached).
+    Returns: (font, font_size, lines)
+    """
+    size = font_size
+    while True:
+        font = load_font(size)
+        lines = wrap(text, font, max_width)
+        if len(lines) <= max_lines or size <= min_font_size:
+            break
+        size = max(min_font_size, size - step)
+
+    if len(lines) > max_lines:
+        lines = lines[:max_lines - 1] + [_truncate(lines[max_lines - 1], font, max_width)]
+    return font, size, lines